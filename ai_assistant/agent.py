@@ -1,5 +1,10 @@
+from functools import cache
 from llama_index.core import PromptTemplate
-from llama_index.core.agent import ReActAgent
+from llama_index.core.agent import AgentRunner, FunctionCallingAgent, ReActAgent
+from ai_assistant.budget import static_prompt_tokens
+from ai_assistant.config import get_agent_settings
+from ai_assistant.prompts import agent_prompt_tpl, function_calling_agent_prompt
+from ai_assistant.rags import get_llm
 from ai_assistant.tools import (
     travel_guide_tool,
     flight_tool,
@@ -10,22 +15,55 @@ from ai_assistant.tools import (
     wikipedia_tool
 )
 
+AGENT_TOOLS = [
+    travel_guide_tool,
+    flight_tool,
+    hotel_tool,
+    bus_tool,
+    restaurant_tool,
+    trip_summary_tool,
+    wikipedia_tool
+]
+
+
 class TravelAgent:
+    """The travel agent, as a ReAct agent or, with AGENT_MODE=function_calling, a function calling one.
+
+    The ReAct agent runs one tool per LLM round trip. The function calling
+    agent uses the LLM's native tool calls: every call the LLM makes in one
+    turn runs concurrently, and all the results go back in the next turn.
+    The system prompt only applies to the ReAct agent, whose prompt also
+    defines the output format.
+    """
+
     def __init__(self, system_prompt: PromptTemplate | None = None):
-        self.agent = ReActAgent.from_tools(
-            [
-                travel_guide_tool,
-                flight_tool,
-                hotel_tool,
-                bus_tool,
-                restaurant_tool,
-                trip_summary_tool,
-                wikipedia_tool
-            ],
-            verbose=True,
-        )
-        if system_prompt is not None:
-            self.agent.update_prompts({"agent_worker:system_prompt": system_prompt})
-
-    def get_agent(self) -> ReActAgent:
+        settings = get_agent_settings()
+        if settings.agent_mode == "function_calling":
+            self.agent = FunctionCallingAgent.from_tools(
+                AGENT_TOOLS,
+                llm=get_llm(),
+                verbose=settings.agent_verbose,
+                allow_parallel_tool_calls=settings.parallel_tool_calls,
+                system_prompt=function_calling_agent_prompt,
+            )
+        elif settings.agent_mode == "react":
+            self.agent = ReActAgent.from_tools(
+                AGENT_TOOLS,
+                llm=get_llm(),
+                verbose=settings.agent_verbose,
+            )
+            if system_prompt is not None:
+                self.agent.update_prompts({"agent_worker:system_prompt": system_prompt})
+        else:
+            raise ValueError(f"Unknown agent mode: {settings.agent_mode}")
+
+    def get_agent(self) -> AgentRunner:
         return self.agent
+
+
+@cache
+def prompt_footprint() -> dict:
+    """Tokens of the agent prompt that are sent on every step."""
+    if get_agent_settings().agent_mode == "function_calling":
+        return static_prompt_tokens(function_calling_agent_prompt, AGENT_TOOLS)
+    return static_prompt_tokens(agent_prompt_tpl.template, AGENT_TOOLS)
@@ -1,125 +1,440 @@
-from fastapi import FastAPI, Depends, Query
-from llama_index.core.agent import ReActAgent
-from ai_assistant.agent import TravelAgent
+from contextlib import asynccontextmanager, AsyncExitStack
+from fastapi import Depends, FastAPI, Path, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from ai_assistant.pool import get_agent_pool
+from ai_assistant.agent import prompt_footprint
+from ai_assistant.cache import get_response_cache
+from ai_assistant.coalescing import SingleFlight, request_key
+from ai_assistant.executor import run_blocking
+from ai_assistant.limits import ConcurrencyLimiter, OverloadedError
+from ai_assistant.observability import (
+    RequestTrace,
+    configure_logging,
+    current_trace,
+    http_request_duration,
+    instrument,
+    render_metrics,
+)
+from ai_assistant.streaming import sse_event, stream_agent_events
+from ai_assistant.router import FastPath, run_fast_path, stream_fast_path, travel_guide_route, trip_report_route
+from ai_assistant.prompts import trip_report_prompt
+from ai_assistant.rags import warmup, is_warm, get_travel_guide
 from ai_assistant.config import get_agent_settings
-from ai_assistant.models import AgentAPIResponse, RecommendationRequest, ReservationRequest, HotelReservationRequest,RestaurantReservationRequest, TripReservation
+from ai_assistant.sessions import get_session_manager
+from ai_assistant.store import TripScope, current_trip, trip_exists, trip_scope
+from ai_assistant.models import TRIP_ID_PATTERN, AgentAPIResponse, ChatRequest, ChatResponse, RecommendationRequest, ReservationRequest, HotelReservationRequest,RestaurantReservationRequest, TripReservation, ItineraryItem, ItineraryRequest, ItineraryResponse
 from ai_assistant.tools import (
     reserve_flight,
     reserve_bus,
     reserve_hotel,
-    reserve_restaurant
+    reserve_restaurant,
+    flight_reservation,
+    bus_reservation,
+    hotel_reservation,
+    restaurant_reservation,
 )
+from ai_assistant.utils import save_reservations
 import json
-from ai_assistant.prompts import agent_prompt_tpl
+import time
+import uuid
+import logging
 
 SETTINGS = get_agent_settings()
+logger = logging.getLogger(__name__)
+
+configure_logging()
+instrument()
+
+agent_limiter = ConcurrencyLimiter(SETTINGS.agent_pool_size, SETTINGS.agent_queue_size)
+agent_flights = SingleFlight(SETTINGS.coalescing_wait_timeout_seconds)
+
+
+def use_fast_path(fast_path: FastPath | None) -> bool:
+    return fast_path is not None and SETTINGS.fast_paths_enabled
+
+
+async def run_agent(
+    endpoint: str | None,
+    city: str | None,
+    notes: list[str] | None,
+    prompt: str,
+    fast_path: FastPath | None = None,
+) -> AgentAPIResponse:
+    cache_enabled = SETTINGS.response_cache_enabled and endpoint is not None
+    response = None
+    if cache_enabled:
+        response = await run_blocking(get_response_cache().get, endpoint, city, notes)
+
+    async def execute() -> str:
+        if use_fast_path(fast_path):
+            async with agent_limiter.acquire():
+                response = await run_fast_path(fast_path)
+        else:
+            async with agent_limiter.acquire(), get_agent_pool().checkout() as agent:
+                response = str(await agent.achat(prompt))
+        if cache_enabled:
+            await run_blocking(get_response_cache().set, endpoint, city, notes, response)
+        return response
+
+    if response is None:
+        if SETTINGS.coalescing_enabled and endpoint is not None:
+            # Identical concurrent requests share one run instead of each starting their own.
+            response = await agent_flights.run(request_key(endpoint, city, notes), execute, endpoint)
+        else:
+            response = await execute()
+
+    return AgentAPIResponse(status="OK", agent_response=response)
+
+
+async def stream_agent(
+    endpoint: str | None,
+    city: str | None,
+    notes: list[str] | None,
+    prompt: str,
+    fast_path: FastPath | None = None,
+) -> StreamingResponse:
+    cache_enabled = SETTINGS.response_cache_enabled and endpoint is not None
+    if cache_enabled:
+        response = await run_blocking(get_response_cache().get, endpoint, city, notes)
+        if response is not None:
+            events = [sse_event("token", {"text": response}), sse_event("done", {"response": response})]
+            return StreamingResponse(iter(events), media_type="text/event-stream")
+
+    # Overload still fails fast with a 429. The slot and the agent are only taken
+    # once the stream starts, so a response that is never sent holds neither.
+    agent_limiter.check()
+
+    async def events():
+        async with AsyncExitStack() as stack:
+            try:
+                await stack.enter_async_context(agent_limiter.acquire())
+            except OverloadedError as e:
+                # Filled up since the check above.
+                yield sse_event("error", {"status": "ERROR", "detail": str(e)})
+                return
+            if use_fast_path(fast_path):
+                agent_events = stream_fast_path(fast_path)
+            else:
+                agent = await stack.enter_async_context(get_agent_pool().checkout())
+                agent_events = stream_agent_events(agent, prompt)
+            async for event, data in agent_events:
+                if event == "done" and cache_enabled:
+                    await run_blocking(get_response_cache().set, endpoint, city, notes, data["response"])
+                yield sse_event(event, data)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def cities_prompt(notes: list[str]) -> str:
+    return f"Recommend cities in Bolivia to visit with the following notes: {notes}"
+
 
+def places_prompt(city: str, notes: list[str] | None) -> str:
+    if notes:
+        return f"Recommend places to visit in the {city} in Bolivia with the following notes: {notes}. Only return places, not restaurants or hotels or activities."
+    return f"Recommend places to visit in the {city} in Bolivia. Only return places, not restaurants or hotels or activities."
+
+
+def hotels_prompt(city: str, notes: list[str] | None) -> str:
+    if notes:
+        return f"Recommend hotels to stay in the {city} in Bolivia with the following notes: {notes}"
+    return f"Recommend hotels to stay in the {city} in Bolivia."
+
+
+def activities_prompt(city: str, notes: list[str] | None) -> str:
+    if notes:
+        return f"Recommend activities to do in the {city} in Bolivia with the following notes: {notes}"
+    return f"Recommend activities to do in the {city} in Bolivia."
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_agent_pool()
+    if SETTINGS.warmup_travel_guide:
+        await run_blocking(warmup)
+    yield
 
-def get_agent() -> ReActAgent:
-    return TravelAgent(agent_prompt_tpl).get_agent()
+
+app = FastAPI(title="AI Agent", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    trace = RequestTrace(request.headers.get("X-Request-ID") or uuid.uuid4().hex)
+    token = current_trace.set(trace)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = trace.request_id
+        return response
+    finally:
+        # Streaming responses are timed until their headers are sent.
+        duration = time.perf_counter() - start
+        route = request.scope.get("route")
+        http_request_duration.observe(
+            duration,
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=str(status),
+        )
+        logger.info(
+            "%s %s %d",
+            request.method,
+            request.url.path,
+            status,
+            extra={
+                "duration_ms": round(duration * 1000, 2),
+                "llm_calls": trace.llm_calls,
+                "prompt_tokens": trace.prompt_tokens,
+                "completion_tokens": trace.completion_tokens,
+                "prompt_components": trace.prompt_components,
+                "tool_calls": trace.tool_calls,
+            },
+        )
+        current_trace.reset(token)
+
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError):
+    return JSONResponse(
+        status_code=429,
+        content={"status": "ERROR", "detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.get("/ready")
+def ready():
+    components = {"agent_pool": get_agent_pool.cache_info().currsize > 0, "travel_guide": is_warm()}
+    # Workers that skip the warmup only serve reservations and are ready without the guide.
+    is_ready = components["agent_pool"] and (components["travel_guide"] or not SETTINGS.warmup_travel_guide)
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"status": "OK" if is_ready else "STARTING", "components": components},
+    )
 
 
-app = FastAPI(title="AI Agent")
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats")
+def stats():
+    stats = {
+        "agent_pool": get_agent_pool().stats(),
+        "agent_limiter": agent_limiter.stats(),
+        "agent_coalescing": agent_flights.stats(),
+        "chat_sessions": get_session_manager().stats(),
+        "prompt_tokens": prompt_footprint(),
+    }
+    if SETTINGS.response_cache_enabled:
+        stats["response_cache"] = get_response_cache().stats()
+    if is_warm():
+        stats["retrieval_cache"] = get_travel_guide().retrieval_cache.stats()
+    return stats
+
+
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    session_id = request.session_id or uuid.uuid4().hex
+    async with agent_limiter.acquire():
+        with trip_scope(request.trip_id, request.user_id):
+            response = await get_session_manager().chat(session_id, request.message)
+    return ChatResponse(status="OK", agent_response=response, session_id=session_id)
+
+@app.delete("/chat/{session_id}")
+def end_chat(session_id: str):
+    get_session_manager().end_session(session_id)
+    return {"status": "OK"}
 
 
 @app.get("/recommendations/cities")
-def recommend_cities(
-    notes: list[str] = Query(...), agent: ReActAgent = Depends(get_agent)
+async def recommend_cities(
+    notes: list[str] = Query(...)
 ):
-    prompt = f"Recommend cities in Bolivia to visit with the following notes: {notes}"
-    return AgentAPIResponse(status="OK", agent_response=str(agent.chat(prompt)))
+    prompt = cities_prompt(notes)
+    return await run_agent("cities", None, notes, prompt, travel_guide_route(prompt))
+
+@app.get("/recommendations/cities/stream")
+async def recommend_cities_stream(
+    notes: list[str] = Query(...)
+):
+    prompt = cities_prompt(notes)
+    return await stream_agent("cities", None, notes, prompt, travel_guide_route(prompt))
 
 @app.get("/recommendations/places")
-def recommend_places(
+async def recommend_places(
     city: str = Query(...),
-    notes: list[str] = Query(None), agent: ReActAgent = Depends(get_agent)
+    notes: list[str] = Query(None)
 ):
-    if notes:
-        prompt = f"Recommend places to visit in the {city} in Bolivia with the following notes: {notes}. Only return places, not restaurants or hotels or activities."
-    else:
-        prompt = f"Recommend places to visit in the {city} in Bolivia. Only return places, not restaurants or hotels or activities."
-    return AgentAPIResponse(status="OK", agent_response=str(agent.chat(prompt)))
+    prompt = places_prompt(city, notes)
+    return await run_agent("places", city, notes, prompt, travel_guide_route(prompt, city, "place"))
+
+@app.get("/recommendations/places/stream")
+async def recommend_places_stream(
+    city: str = Query(...),
+    notes: list[str] = Query(None)
+):
+    prompt = places_prompt(city, notes)
+    return await stream_agent("places", city, notes, prompt, travel_guide_route(prompt, city, "place"))
 
 @app.get("/recommendations/hotels")
-def recommend_hotels(
+async def recommend_hotels(
     city: str = Query(...),
-    notes: list[str] = Query(None), agent: ReActAgent = Depends(get_agent)
+    notes: list[str] = Query(None)
 ):
-    if notes:
-        prompt = f"Recommend hotels to stay in the {city} in Bolivia with the following notes: {notes}"
-    else:
-        prompt = f"Recommend hotels to stay in the {city} in Bolivia."
-    return AgentAPIResponse(status="OK", agent_response=str(agent.chat(prompt)))
+    prompt = hotels_prompt(city, notes)
+    return await run_agent("hotels", city, notes, prompt, travel_guide_route(prompt, city, "hotel"))
+
+@app.get("/recommendations/hotels/stream")
+async def recommend_hotels_stream(
+    city: str = Query(...),
+    notes: list[str] = Query(None)
+):
+    prompt = hotels_prompt(city, notes)
+    return await stream_agent("hotels", city, notes, prompt, travel_guide_route(prompt, city, "hotel"))
 
 @app.get("/recommendations/activities")
-def recommend_activities(
+async def recommend_activities(
     city: str = Query(...),
-    notes: list[str] = Query(None), agent: ReActAgent = Depends(get_agent)
+    notes: list[str] = Query(None)
 ):
-    if notes:
-        prompt = f"Recommend activities to do in the {city} in Bolivia with the following notes: {notes}"
-    else:
-        prompt = f"Recommend activities to do in the {city} in Bolivia."
-    return AgentAPIResponse(status="OK", agent_response=str(agent.chat(prompt)))
+    prompt = activities_prompt(city, notes)
+    return await run_agent("activities", city, notes, prompt, travel_guide_route(prompt, city, "activity"))
 
+@app.get("/recommendations/activities/stream")
+async def recommend_activities_stream(
+    city: str = Query(...),
+    notes: list[str] = Query(None)
+):
+    prompt = activities_prompt(city, notes)
+    return await stream_agent("activities", city, notes, prompt, travel_guide_route(prompt, city, "activity"))
+
+
+def trip_params(
+    trip_id: str | None = Query(None, pattern=TRIP_ID_PATTERN),
+    user_id: str | None = Query(None),
+) -> TripScope:
+    # A dependency, so the reservation request models stay the endpoints' only query models.
+    return TripScope(trip_id, user_id)
 
 @app.post("/reservations/flight")
-def reserve_flight_api(request: ReservationRequest = Query(...)):
-    reservation = reserve_flight(
-        request.destination,
-        request.origin,
-        request.date)
+def reserve_flight_api(
+    request: ReservationRequest = Query(...),
+    trip: TripScope = Depends(trip_params),
+):
+    with trip_scope(trip.trip_id, trip.user_id):
+        reservation = reserve_flight(
+            request.destination,
+            request.origin,
+            request.date)
     return AgentAPIResponse(status="OK", agent_response=str(reservation))
 
 @app.post("/reservations/bus")
-def reserve_bus_api(request: ReservationRequest = Query(...)):
-    reservation = reserve_bus(
-        request.date,
-        request.origin,
-        request.destination)
+def reserve_bus_api(
+    request: ReservationRequest = Query(...),
+    trip: TripScope = Depends(trip_params),
+):
+    with trip_scope(trip.trip_id, trip.user_id):
+        reservation = reserve_bus(
+            request.date,
+            request.origin,
+            request.destination)
     return AgentAPIResponse(status="OK", agent_response=str(reservation))
 
 @app.post("/reservations/hotel")
-def reserve_hotel_api(request: HotelReservationRequest = Query(...)):
-    reservation = reserve_hotel(
-        request.checkin_date,
-        request.checkout_date,
-        request.hotel, request.city)
+def reserve_hotel_api(
+    request: HotelReservationRequest = Query(...),
+    trip: TripScope = Depends(trip_params),
+):
+    with trip_scope(trip.trip_id, trip.user_id):
+        reservation = reserve_hotel(
+            request.checkin_date,
+            request.checkout_date,
+            request.hotel, request.city)
     return AgentAPIResponse(status="OK", agent_response=str(reservation))
 
 @app.post("/reservations/restaurant")
-def reserve_restaurant_api(request: RestaurantReservationRequest = Query(...)):
+def reserve_restaurant_api(
+    request: RestaurantReservationRequest = Query(...),
+    trip: TripScope = Depends(trip_params),
+):
 
     if not request.dish:
         request.dish = "not specified"
 
-    reservation = reserve_restaurant(
-        f"{request.date}T{request.time}", 
-        request.restaurant, 
-        request.city, 
-        request.dish
-    )
+    with trip_scope(trip.trip_id, trip.user_id):
+        reservation = reserve_restaurant(
+            f"{request.date}T{request.time}", 
+            request.restaurant, 
+            request.city, 
+            request.dish
+        )
     return AgentAPIResponse(status="OK", agent_response=str(reservation))
 
-@app.get("/trip_summary")
-def trip_summary(agent: ReActAgent = Depends(get_agent)):
+def itinerary_reservation(item: ItineraryItem):
+    if item.type == "flight":
+        return flight_reservation(item.destination, item.origin, item.date)
+    if item.type == "bus":
+        return bus_reservation(item.date, item.origin, item.destination)
+    if item.type == "hotel":
+        return hotel_reservation(item.checkin_date, item.checkout_date, item.hotel, item.city)
+    return restaurant_reservation(
+        f"{item.date}T{item.time}", item.restaurant, item.city, item.dish or "not specified"
+    )
 
-    prompt = f"""
-        Please generate a trip summary using the tool `trip_summary_tool`.
-        After generating the trip summary, analyze it and generate a detailed report.
+@app.post("/reservations/itinerary")
+def reserve_itinerary_api(request: ItineraryRequest):
+    # Every item is validated before anything is saved; the batch is one store write.
+    reservations, errors = [], []
+    with trip_scope(request.trip_id, request.user_id):
+        for position, item in enumerate(request.reservations):
+            try:
+                reservations.append(itinerary_reservation(item))
+            except ValueError as e:
+                errors.append({"index": position, "type": item.type, "detail": str(e)})
+    if errors:
+        return JSONResponse(status_code=422, content={"status": "ERROR", "detail": errors})
 
-        The detailed report should include:
-        1. Key highlights of the trip.
-        2. Any identified issues or recommendations.
-        3. Additional insights based on the generated trip summary.
+    save_reservations(reservations)
+    return ItineraryResponse(
+        status="OK",
+        reservations=reservations,
+        total_cost=sum(reservation.cost for reservation in reservations),
+    )
 
-        Use the `trip_summary_tool` to create the summary as the first step, then follow with the report.
+def unknown_trip(trip_id: str) -> JSONResponse:
+    return JSONResponse(status_code=404, content={"status": "ERROR", "detail": f"Unknown trip: {trip_id}"})
 
-        Please include both the trip summary and the detailed report in **Spanish** in your **final Answer**.
-        Make sure to return both the summary and the detailed report as part of the final **Answer**, and not as internal thoughts or reasoning.
-        """
+async def trip_report(trip_id: str | None):
+    if trip_id is not None and not trip_exists(trip_id):
+        return unknown_trip(trip_id)
+    with trip_scope(trip_id):
+        return await run_agent(None, None, None, trip_report_prompt, trip_report_route(trip_id))
 
-    return AgentAPIResponse(
-        status="OK",
-        agent_response=str(agent.chat(prompt))
-    )
\ No newline at end of file
+async def trip_report_stream(trip_id: str | None):
+    if trip_id is not None and not trip_exists(trip_id):
+        return unknown_trip(trip_id)
+    # Each request runs in its own task and context, so the trip set here also
+    # covers the stream, which is consumed after this returns.
+    current_trip.set(TripScope(trip_id))
+    return await stream_agent(None, None, None, trip_report_prompt, trip_report_route(trip_id))
+
+@app.get("/trip_summary")
+async def trip_summary(trip_id: str | None = Query(None, pattern=TRIP_ID_PATTERN)):
+    return await trip_report(trip_id)
+
+@app.get("/trip_summary/stream")
+async def trip_summary_stream(trip_id: str | None = Query(None, pattern=TRIP_ID_PATTERN)):
+    return await trip_report_stream(trip_id)
+
+@app.get("/trips/{trip_id}/summary")
+async def trip_summary_by_id(trip_id: str = Path(..., pattern=TRIP_ID_PATTERN)):
+    return await trip_report(trip_id)
+
+@app.get("/trips/{trip_id}/summary/stream")
+async def trip_summary_by_id_stream(trip_id: str = Path(..., pattern=TRIP_ID_PATTERN)):
+    return await trip_report_stream(trip_id)
@@ -0,0 +1,335 @@
+"""Offline benchmark of the API, retrieval, ingestion and the reservation store.
+
+Runs entirely locally: the LLM, the embedding model and Wikipedia are
+replaced by the stand-ins in ai_assistant.mocks, and every store lives in a
+temporary directory. With --openai-base-url the LLM calls go through the
+managed OpenAI client to a server such as ai_assistant.mock_openai instead.
+
+    python -m ai_assistant.benchmark --requests 200 --concurrency 32 --llm-latency 0.2
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+CITIES = ["La Paz", "Sucre", "Potosí", "Cochabamba", "Santa Cruz", "Uyuni", "Oruro", "Tarija"]
+NOTES = ["cultura", "historia", "comida local", "aventura", "naturaleza", "presupuesto bajo", "familia"]
+QUERIES = [
+    "hoteles en Sucre",
+    "restaurantes en La Paz",
+    "qué hacer en Uyuni",
+    "museos en Potosí",
+    "excursiones desde Cochabamba",
+    "mercados de Santa Cruz",
+    "festivales en Oruro",
+    "vinos de Tarija",
+]
+
+
+def percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def at(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+
+    return {
+        "p50_ms": at(0.50),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def configure_environment(args: argparse.Namespace, workdir: str):
+    # Settings are read once, so this must run before anything from ai_assistant is imported.
+    os.environ.update(
+        {
+            "LLM_BACKEND": "mock",
+            "EMBEDDINGS_BACKEND": "mock",
+            "WIKIPEDIA_BACKEND": "static",
+            "MOCK_LLM_LATENCY_SECONDS": str(args.llm_latency),
+            "TRAVEL_GUIDE_STORE_PATH": os.path.join(workdir, "travel_guide_store"),
+            "TRAVEL_GUIDE_DATA_PATH": os.path.join(workdir, "data"),
+            "RESERVATION_STORE_PATH": os.path.join(workdir, "trip.db"),
+            "TRIP_STORE_PATH": os.path.join(workdir, "trips"),
+            "LOG_FILE": os.path.join(workdir, "trip.json"),
+            "WIKIPEDIA_CACHE_PATH": os.path.join(workdir, "wikipedia_cache.db"),
+            "RESPONSE_CACHE_ENABLED": str(args.response_cache).lower(),
+            "RESPONSE_CACHE_PATH": os.path.join(workdir, "response_cache.db"),
+            "FAST_PATHS_ENABLED": str(not args.no_fast_paths).lower(),
+            "AGENT_MODE": args.agent_mode,
+            "PARALLEL_TOOL_CALLS": str(not args.sequential_tool_calls).lower(),
+            "COALESCING_ENABLED": str(not args.no_coalescing).lower(),
+        }
+    )
+    if args.openai_base_url:
+        # Exercises the managed OpenAI client against an OpenAI-compatible server, e.g. ai_assistant.mock_openai.
+        os.environ.update({"LLM_BACKEND": "openai", "OPENAI_API_BASE": args.openai_base_url})
+    if args.llm_tokens_per_second:
+        os.environ["MOCK_LLM_TOKENS_PER_SECOND"] = str(args.llm_tokens_per_second)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def write_corpus(data_dir: str, documents: int, paragraphs: int, rng: random.Random):
+    os.makedirs(data_dir, exist_ok=True)
+    topics = [
+        "El hotel {name} en {city} ofrece habitaciones cómodas cerca de la plaza principal.",
+        "El restaurante {name} de {city} sirve cocina boliviana tradicional y platos de temporada.",
+        "Desde {city} salen tours y excursiones de trekking a los alrededores.",
+        "El museo {name} de {city} guarda colecciones de arte colonial y textiles andinos.",
+        "La iglesia de {name} es uno de los lugares más visitados de {city}.",
+    ]
+    for document in range(documents):
+        city = CITIES[document % len(CITIES)]
+        text = "\n\n".join(
+            rng.choice(topics).format(name=f"{city} {paragraph}", city=city) for paragraph in range(paragraphs)
+        )
+        with open(os.path.join(data_dir, f"guide_{document:04d}.txt"), "w", encoding="utf-8") as file:
+            file.write(text)
+
+
+def bench_ingestion(args: argparse.Namespace) -> dict:
+    from ai_assistant.rags import get_travel_guide
+
+    start = time.perf_counter()
+    guide = get_travel_guide()
+    seconds = time.perf_counter() - start
+    chunks = len(guide.index.docstore.docs)
+    return {
+        "documents": args.documents,
+        "chunks": chunks,
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(chunks / seconds, 1),
+    }
+
+
+def bench_retrieval(args: argparse.Namespace) -> dict:
+    from llama_index.core import QueryBundle
+    from ai_assistant.rags import get_travel_guide
+    from ai_assistant.retrieval import RETRIEVAL_MODES
+
+    results = {}
+    for mode in RETRIEVAL_MODES:
+        retriever = get_travel_guide().get_query_engine(mode).retriever
+        get_travel_guide().retrieval_cache.clear_results()
+        results[mode] = {}
+        # Every query is new on the first pass and cached on the second.
+        for name in ("cold", "warm"):
+            latencies = []
+            for repeat in range(args.retrieval_queries):
+                query = f"{QUERIES[repeat % len(QUERIES)]} {repeat}"
+                start = time.perf_counter()
+                retriever.retrieve(QueryBundle(query))
+                latencies.append(time.perf_counter() - start)
+            results[mode][name] = percentiles(latencies)
+    return results
+
+
+def reservation_record(rng: random.Random, position: int) -> dict:
+    return {
+        "trip_type": "FLIGHT",
+        "date": f"2025-{1 + position % 12:02d}-{1 + position % 28:02d}",
+        "departure": rng.choice(CITIES),
+        "destination": rng.choice(CITIES),
+        "cost": rng.randint(50, 700),
+        "reservation_type": "TripReservation",
+    }
+
+
+def bench_reservations(args: argparse.Namespace, workdir: str, rng: random.Random) -> dict:
+    from ai_assistant.config import get_agent_settings
+    from ai_assistant.store import STORES
+    from ai_assistant.tools import format_trip_summary
+
+    backend = get_agent_settings().reservation_store
+    results = {}
+    for size in args.log_sizes:
+        store = STORES[backend](os.path.join(workdir, f"reservations_{size}.{backend}"))
+        store.extend([reservation_record(rng, position) for position in range(size)])
+
+        save_latencies, summary_latencies = [], []
+        for sample in range(args.samples):
+            record = reservation_record(rng, size + sample)
+            start = time.perf_counter()
+            store.append(record)
+            save_latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            format_trip_summary(store)
+            summary_latencies.append(time.perf_counter() - start)
+
+        results[str(size)] = {
+            "save_reservation": percentiles(save_latencies),
+            "trip_summary": percentiles(summary_latencies),
+        }
+    return results
+
+
+def endpoint_requests(rng: random.Random) -> dict:
+    """Endpoint name -> function building (method, url, kwargs) for the i-th request."""
+    return {
+        "cities": lambda i: ("GET", "/recommendations/cities", {"params": {"notes": rng.sample(NOTES, 2)}}),
+        "hotels": lambda i: (
+            "GET",
+            "/recommendations/hotels",
+            {"params": {"city": rng.choice(CITIES), "notes": rng.sample(NOTES, 1)}},
+        ),
+        # A trending city: every request is identical.
+        "burst": lambda i: ("GET", "/recommendations/places", {"params": {"city": "Uyuni", "notes": ["aventura"]}}),
+        "trip_summary": lambda i: ("GET", "/trip_summary", {}),
+        "chat": lambda i: (
+            "POST",
+            "/chat",
+            {"json": {"message": rng.choice(QUERIES), "session_id": f"bench-{i % 50}"}},
+        ),
+        "booking": lambda i: (
+            "POST",
+            "/chat",
+            {"json": {"message": "Reserva un vuelo de La Paz a Sucre, un hotel en Sucre y una cena"}},
+        ),
+        "flight": lambda i: (
+            "POST",
+            "/reservations/flight",
+            {"params": {"origin": rng.choice(CITIES), "destination": rng.choice(CITIES), "date": "2025-06-01"}},
+        ),
+        "itinerary": lambda i: (
+            "POST",
+            "/reservations/itinerary",
+            {
+                "json": {
+                    "reservations": [
+                        {"type": "flight", "origin": "La Paz", "destination": "Sucre", "date": "2025-06-01"},
+                        {
+                            "type": "hotel",
+                            "checkin_date": "2025-06-01",
+                            "checkout_date": "2025-06-04",
+                            "hotel": "Parador",
+                            "city": "Sucre",
+                        },
+                        {"type": "bus", "origin": "Sucre", "destination": "Potosí", "date": "2025-06-04"},
+                    ]
+                }
+            },
+        ),
+    }
+
+
+async def bench_endpoints(args: argparse.Namespace, rng: random.Random) -> dict:
+    import httpx
+    from ai_assistant.api import agent_flights, app, lifespan
+
+    requests = endpoint_requests(rng)
+    results = {}
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            for name in args.endpoints:
+                semaphore = asyncio.Semaphore(args.concurrency)
+                latencies, statuses = [], {}
+
+                async def call(i: int):
+                    method, url, kwargs = requests[name](i)
+                    async with semaphore:
+                        start = time.perf_counter()
+                        response = await client.request(method, url, **kwargs)
+                        latencies.append(time.perf_counter() - start)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+                start = time.perf_counter()
+                await asyncio.gather(*(call(i) for i in range(args.requests)))
+                seconds = time.perf_counter() - start
+                results[name] = {
+                    "requests": args.requests,
+                    "concurrency": args.concurrency,
+                    "throughput_rps": round(args.requests / seconds, 1),
+                    "statuses": statuses,
+                    **percentiles(latencies),
+                }
+    results["coalescing"] = agent_flights.stats()
+    return results
+
+
+def print_report(report: dict):
+    for section, results in report.items():
+        print(f"\n== {section} ==")
+        for name, values in results.items():
+            if isinstance(values, dict):
+                flat = {
+                    key: value
+                    for key, value in values.items()
+                    if not isinstance(value, dict) or key == "statuses"
+                }
+                nested = {key: value for key, value in values.items() if isinstance(value, dict) and key != "statuses"}
+                print(f"{name:>16}: {json.dumps(flat, ensure_ascii=False) if flat else ''}")
+                for key, value in nested.items():
+                    print(f"{'':>16}  {key}: {json.dumps(value)}")
+            else:
+                print(f"{name:>16}: {values}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--endpoints", nargs="+", default=list(endpoint_requests(random.Random()).keys()))
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Mock LLM seconds per call.")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=None)
+    parser.add_argument("--openai-base-url", help="Send LLM calls to this OpenAI-compatible server instead of the mock LLM.")
+    parser.add_argument("--no-fast-paths", action="store_true", help="Send structured endpoints through the agent.")
+    parser.add_argument("--agent-mode", choices=["react", "function_calling"], default="react")
+    parser.add_argument("--sequential-tool-calls", action="store_true", help="One tool call per function calling turn.")
+    parser.add_argument("--response-cache", action="store_true")
+    parser.add_argument("--no-coalescing", action="store_true", help="Run identical concurrent requests separately.")
+    parser.add_argument("--documents", type=int, default=50, help="Synthetic travel guide documents.")
+    parser.add_argument("--paragraphs", type=int, default=40, help="Paragraphs per document.")
+    parser.add_argument("--retrieval-queries", type=int, default=200)
+    parser.add_argument("--log-sizes", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--samples", type=int, default=50, help="Samples per reservation log size.")
+    parser.add_argument(
+        "--skip",
+        nargs="*",
+        default=[],
+        choices=["ingestion", "retrieval", "reservations", "endpoints"],
+        help="Sections to leave out. Retrieval and endpoints need the index, so without them skipping "
+        "ingestion saves its time; with them it is still built, just not reported.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the report as JSON to this path.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="ai_assistant_bench_") as workdir:
+        configure_environment(args, workdir)
+        report = {}
+        from ai_assistant.config import get_agent_settings
+
+        write_corpus(get_agent_settings().travel_guide_data_path, args.documents, args.paragraphs, rng)
+        if "ingestion" not in args.skip:
+            report["ingestion"] = bench_ingestion(args)
+        elif not {"retrieval", "endpoints"} <= set(args.skip):
+            # Built up front so it does not count toward the first retrieval or request.
+            from ai_assistant.rags import get_travel_guide
+
+            get_travel_guide()
+        if "retrieval" not in args.skip:
+            report["retrieval"] = bench_retrieval(args)
+        if "reservations" not in args.skip:
+            report["reservations"] = bench_reservations(args, workdir, rng)
+        if "endpoints" not in args.skip:
+            report["endpoints"] = asyncio.run(bench_endpoints(args, rng))
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
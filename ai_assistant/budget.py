@@ -0,0 +1,157 @@
+import re
+import inspect
+import textwrap
+from functools import wraps
+from typing import Any, Callable, Sequence
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.tools import BaseTool
+from llama_index.core.agent.react.formatter import get_react_tool_descriptions
+from llama_index.core.utils import get_tokenizer
+from ai_assistant.config import get_agent_settings
+
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer()(text))
+
+
+def compact_prompt(text: str) -> str:
+    """Drops the source indentation and trailing spaces of a prompt written as an indented string."""
+    lines = [line.rstrip() for line in textwrap.dedent(text).strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)) + "\n"
+
+
+def truncate_sentences(text: str, budget: int) -> str:
+    kept, used = [], 0
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        cost = count_tokens(sentence) + 1
+        if kept and used + cost > budget:
+            break
+        kept.append(sentence)
+        used += cost
+    return " ".join(kept)
+
+
+def compact_description(docstring: str, budget: int | None = None) -> str:
+    """One-paragraph tool description for the agent prompt.
+
+    Tool docstrings follow a markdown layout with Usage, Output and Notes
+    sections. The argument list already reaches the prompt through the tool
+    schema and the output is described by the observation itself, so only the
+    summary, the per-argument hints and the notes are kept.
+    """
+    settings = get_agent_settings()
+    if budget is None:
+        budget = settings.tool_description_token_budget
+    if not settings.prompt_compaction:
+        return docstring
+
+    summary, *sections = re.split(r"^\s*###\s+", textwrap.dedent(docstring), flags=re.MULTILINE)
+    parts = [" ".join(summary.split())]
+    for section in sections:
+        title, _, body = section.partition("\n")
+        title = title.strip().lower()
+        if title == "usage":
+            arguments = re.findall(r"^\s*\d+\.\s+\*\*(\w+)\*\*:\s*(.+)$", body, flags=re.MULTILINE)
+            if arguments:
+                hints = "; ".join(f"{name}: {hint.strip().rstrip('.')}" for name, hint in arguments)
+                parts.append(f"Args: {hints}.")
+        elif title == "notes":
+            notes = re.findall(r"^\s*-\s+(.+)$", body, flags=re.MULTILINE)
+            parts.extend(note.strip() for note in notes)
+    return truncate_sentences(" ".join(part for part in parts if part), budget)
+
+
+def fit_tokens(text: str, budget: int) -> str:
+    """Cuts an oversized text to about ``budget`` tokens, keeping its head and its tail.
+
+    Tool outputs put their totals and conclusions at the end, so a quarter of
+    the budget goes to the tail.
+    """
+    tokenizer = get_tokenizer()
+    tokens = len(tokenizer(text))
+    if tokens <= budget:
+        return text
+    head = text[: len(text) * (budget * 3 // 4) // tokens]
+    tail = text[len(text) - len(text) * (budget // 4) // tokens :]
+    # Cut on line boundaries when there are any, so no record is left half-written.
+    head = head[: head.rfind("\n")] if "\n" in head else head
+    tail = tail[tail.find("\n") + 1 :] if "\n" in tail else tail
+    omitted = tokens - len(tokenizer(head)) - len(tokenizer(tail))
+    return f"{head.rstrip()}\n[... {omitted} tokens omitted ...]\n{tail.lstrip()}"
+
+
+def fit_observation(text: str) -> str:
+    budget = get_agent_settings().tool_output_token_budget
+    return text if budget is None else fit_tokens(text, budget)
+
+
+def budgeted(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Tool function whose text output is cut to the observation budget before it reaches the prompt."""
+
+    if inspect.iscoroutinefunction(fn):
+
+        @wraps(fn)
+        async def abudgeted_fn(*args, **kwargs):
+            output = await fn(*args, **kwargs)
+            return fit_observation(output) if isinstance(output, str) else output
+
+        return abudgeted_fn
+
+    @wraps(fn)
+    def budgeted_fn(*args, **kwargs):
+        output = fn(*args, **kwargs)
+        return fit_observation(output) if isinstance(output, str) else output
+
+    return budgeted_fn
+
+
+TOOL_DESCRIPTION = re.compile(r"> Tool Name: .*?\nTool Args: .*?\n", re.DOTALL)
+
+
+def prompt_components(messages: Sequence[ChatMessage]) -> dict[str, int]:
+    """Tokens of a ReAct chat prompt by component.
+
+    The ReAct formatter sends the system prompt (tool descriptions included),
+    the chat history, the user's message and then the reasoning steps, with
+    tool observations as user messages starting with "Observation:". Function
+    calling agents send observations as tool messages instead, and their tool
+    descriptions outside of the messages.
+    """
+    components = dict.fromkeys(("system", "tools", "history", "user", "reasoning", "observations"), 0)
+    is_observation = [
+        message.role == MessageRole.TOOL
+        or (message.role == MessageRole.USER and str(message.content or "").startswith("Observation:"))
+        for message in messages
+    ]
+    user_positions = [
+        position
+        for position, message in enumerate(messages)
+        if message.role == MessageRole.USER and not is_observation[position]
+    ]
+    current = user_positions[-1] if user_positions else len(messages)
+
+    for position, message in enumerate(messages):
+        content = str(message.content or "")
+        if message.role == MessageRole.SYSTEM:
+            tools = sum(count_tokens(match) for match in TOOL_DESCRIPTION.findall(content))
+            components["tools"] += tools
+            components["system"] += count_tokens(content) - tools
+        elif position < current:
+            components["history"] += count_tokens(content)
+        elif position == current:
+            components["user"] += count_tokens(content)
+        elif is_observation[position]:
+            components["observations"] += count_tokens(content)
+        else:
+            components["reasoning"] += count_tokens(content)
+    return {component: tokens for component, tokens in components.items() if tokens}
+
+
+def static_prompt_tokens(system_prompt: str, tools: Sequence[BaseTool]) -> dict:
+    """Tokens every agent step pays before any conversation: the system prompt and each tool description."""
+    descriptions = get_react_tool_descriptions(tools)
+    return {
+        "system_prompt": count_tokens(system_prompt),
+        "tools": {tool.metadata.name: count_tokens(text) for tool, text in zip(tools, descriptions)},
+        "tools_total": sum(count_tokens(text) for text in descriptions),
+    }
@@ -0,0 +1,202 @@
+import json
+import time
+import sqlite3
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import cache
+from threading import Lock
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from ai_assistant.config import get_agent_settings
+
+
+@dataclass
+class CacheEntry:
+    scope: str
+    response: str
+    expires_at: float
+    embedding: np.ndarray | None = None
+
+
+class ResponseCache:
+    """LRU + TTL cache of agent responses keyed on (endpoint, city, sorted notes).
+
+    When an embedding model and a similarity threshold are given, a miss on the
+    exact key falls back to the most similar cached notes for the same endpoint
+    and city. Entries are written through to SQLite when a path is given so that
+    they survive restarts and are shared between workers.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        path: str | None = None,
+        embed_model: BaseEmbedding | None = None,
+        similarity_threshold: float | None = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.embed_model = embed_model if similarity_threshold is not None else None
+        self.similarity_threshold = similarity_threshold
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        if self.path is not None:
+            with self._connect() as connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS response_cache "
+                    "(key TEXT PRIMARY KEY, scope TEXT, response TEXT, expires_at REAL, embedding TEXT)"
+                )
+                connection.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+                rows = connection.execute(
+                    "SELECT key, scope, response, expires_at, embedding FROM response_cache "
+                    "ORDER BY expires_at DESC LIMIT ?",
+                    (max_entries,),
+                ).fetchall()
+            for key, scope, response, expires_at, embedding in reversed(rows):
+                self._entries[key] = CacheEntry(scope, response, expires_at, self._load_embedding(embedding))
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def make_key(self, endpoint: str, city: str | None, notes: list[str] | None) -> tuple[str, str, str]:
+        scope = json.dumps([endpoint, self.normalize(city or "")])
+        notes_text = json.dumps(sorted(self.normalize(note) for note in notes or []))
+        return scope, notes_text, f"{scope}:{notes_text}"
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _load_embedding(embedding: str | None) -> np.ndarray | None:
+        return None if embedding is None else np.array(json.loads(embedding), dtype=np.float32)
+
+    def _embed(self, notes_text: str) -> np.ndarray:
+        embedding = np.array(self.embed_model.get_text_embedding(notes_text), dtype=np.float32)
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+
+    def _load_from_disk(self, key: str) -> CacheEntry | None:
+        if self.path is None:
+            return None
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT scope, response, expires_at, embedding FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        scope, response, expires_at, embedding = row
+        return CacheEntry(scope, response, expires_at, self._load_embedding(embedding))
+
+    def _most_similar(self, scope: str, embedding: np.ndarray) -> CacheEntry | None:
+        now = time.time()
+        best, best_score = None, self.similarity_threshold
+        for entry in self._entries.values():
+            if entry.scope != scope or entry.embedding is None or entry.expires_at < now:
+                continue
+            score = float(np.dot(entry.embedding, embedding))
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def get(self, endpoint: str, city: str | None, notes: list[str] | None) -> str | None:
+        scope, notes_text, key = self.make_key(endpoint, city, notes)
+        with self._lock:
+            cached = key in self._entries
+        disk_entry = None if cached else self._load_from_disk(key)
+
+        # Lookup, expiry and recency update happen together: a concurrent set can
+        # otherwise evict the key between them.
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and disk_entry is not None:
+                entry = disk_entry
+                self._store(key, entry)
+            if entry is not None:
+                if entry.expires_at >= time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.response
+                self._entries.pop(key, None)
+
+        if self.embed_model is not None and notes:
+            embedding = self._embed(notes_text)
+            with self._lock:
+                similar = self._most_similar(scope, embedding)
+                if similar is not None:
+                    self.semantic_hits += 1
+                    return similar.response
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, endpoint: str, city: str | None, notes: list[str] | None, response: str):
+        scope, notes_text, key = self.make_key(endpoint, city, notes)
+        embedding = self._embed(notes_text) if self.embed_model is not None and notes else None
+        entry = CacheEntry(scope, response, time.time() + self.ttl_seconds, embedding)
+        with self._lock:
+            evicted = self._store(key, entry)
+
+        if self.path is not None:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        scope,
+                        response,
+                        entry.expires_at,
+                        None if embedding is None else json.dumps(embedding.tolist()),
+                    ),
+                )
+                connection.executemany("DELETE FROM response_cache WHERE key = ?", [(k,) for k in evicted])
+
+    def _store(self, key: str, entry: CacheEntry) -> list[str]:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False)[0])
+        return evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+            }
+
+
+@cache
+def get_response_cache() -> ResponseCache:
+    settings = get_agent_settings()
+    embed_model = None
+    if settings.response_cache_similarity_threshold is not None:
+        from ai_assistant.rags import get_embed_model
+
+        embed_model = get_embed_model()
+
+    return ResponseCache(
+        max_entries=settings.response_cache_max_entries,
+        ttl_seconds=settings.response_cache_ttl_seconds,
+        path=settings.response_cache_path,
+        embed_model=embed_model,
+        similarity_threshold=settings.response_cache_similarity_threshold,
+    )
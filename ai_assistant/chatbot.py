@@ -1,14 +1,15 @@
 import gradio as gr
-from ai_assistant.prompts import agent_prompt_tpl
-from ai_assistant.agent import TravelAgent
+from ai_assistant.observability import configure_logging, instrument
+from ai_assistant.sessions import get_session_manager
 
-agent = TravelAgent(agent_prompt_tpl).get_agent()
 
-
-def agent_response(message, history):
-    return agent.chat(message).response
+async def agent_response(message, history, request: gr.Request):
+    # Each browser session gets its own memory; the agents come from the shared pool.
+    return await get_session_manager().chat(request.session_hash, message)
 
 
 if __name__ == "__main__":
+    configure_logging()
+    instrument()
     demo = gr.ChatInterface(agent_response, type="messages")
     demo.launch()
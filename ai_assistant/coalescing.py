@@ -0,0 +1,72 @@
+import json
+import asyncio
+import logging
+from typing import Awaitable, Callable, Hashable, TypeVar
+from ai_assistant.cache import ResponseCache
+from ai_assistant.observability import coalesced_requests
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def request_key(endpoint: str, city: str | None, notes: list[str] | None) -> str:
+    """The same normalized (endpoint, city, sorted notes) identity the response cache uses."""
+    normalize = ResponseCache.normalize
+    return json.dumps([endpoint, normalize(city or ""), sorted(normalize(note) for note in notes or [])])
+
+
+class SingleFlight:
+    """Shares one in-flight execution between concurrent callers with the same key.
+
+    Unlike a cache, nothing outlives the execution: a caller arriving after it
+    finishes starts a new one. The execution runs in its own task, so a caller
+    that disconnects does not cancel it for the others. Callers that wait
+    longer than ``wait_timeout`` seconds give up on it and run on their own.
+    """
+
+    def __init__(self, wait_timeout: float | None = None):
+        self.wait_timeout = wait_timeout
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def _start(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> asyncio.Task:
+        task = asyncio.ensure_future(fn())
+        self._in_flight[key] = task
+
+        def done(task: asyncio.Task):
+            if self._in_flight.get(key) is task:
+                del self._in_flight[key]
+            # Every caller may be gone; retrieving the exception keeps asyncio from logging it as lost.
+            if not task.cancelled():
+                task.exception()
+
+        task.add_done_callback(done)
+        return task
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[T]], label: str = "") -> T:
+        task = self._in_flight.get(key)
+        if task is None:
+            self.executions += 1
+            coalesced_requests.inc(endpoint=label, outcome="executed")
+            return await asyncio.shield(self._start(key, fn))
+
+        self.coalesced += 1
+        coalesced_requests.inc(endpoint=label, outcome="coalesced")
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.wait_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            coalesced_requests.inc(endpoint=label, outcome="timeout")
+            logger.warning("Gave up waiting for an in-flight %s request after %ss", label, self.wait_timeout)
+            return await fn()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+        }
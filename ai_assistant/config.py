@@ -5,12 +5,85 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class AgentSettings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env")
 
-    openai_model: str = "gpt4o-mini"
+    openai_model: str = "gpt-4o-mini"
     hf_embeddings_model: str = "intfloat/multilingual-e5-base"
     travel_guide_store_path: str = "travel_guide_store"
     travel_guide_data_path: str = "data"
+    vector_store_backend: str = "mmap"
+    vector_index_ivf_min_vectors: int = 50_000
+    vector_index_nprobe: int = 8
+    embed_batch_size: int = 32
+    ingest_workers: int = 1
+    embedding_cache_path: str | None = None
+    retrieval_top_k: int = 4
+    retrieval_prefilter: bool = True
+    retrieval_similarity_cutoff: float | None = None
+    retrieval_mode: str = "hybrid"
+    retrieval_hybrid_candidates: int = 10
+    retrieval_rrf_k: int = 60
+    reranker_model: str | None = None
+    reranker_top_n: int = 2
+    retrieval_cache_max_embeddings: int = 4096
+    retrieval_cache_max_results: int = 1024
+    retrieval_cache_bucket_decimals: int = 2
     openai_api_key: str = "OPENAI_API_KEY"
+    openai_api_base: str | None = None
+    openai_fallback_model: str | None = None
+    llm_timeout_seconds: float = 30.0
+    llm_connect_timeout_seconds: float = 5.0
+    llm_deadline_seconds: float = 90.0
+    llm_attempts: int = 3
+    llm_retry_base_seconds: float = 0.5
+    llm_retry_max_seconds: float = 8.0
+    llm_requests_per_minute: int | None = None
+    llm_tokens_per_minute: int | None = None
+    llm_completion_token_estimate: int = 512
+    llm_max_connections: int = 100
+    llm_max_keepalive_connections: int = 20
+    llm_backend: str = "openai"
+    embeddings_backend: str = "huggingface"
+    onnx_model_path: str = "onnx_model"
+    onnx_quantized: bool = True
+    onnx_threads: int | None = None
+    onnx_max_length: int = 512
+    mock_llm_latency_seconds: float = 0.0
+    mock_llm_tokens_per_second: float | None = None
+    prompt_compaction: bool = True
+    tool_description_token_budget: int = 150
+    tool_output_token_budget: int | None = 1500
+    log_level: str = "INFO"
+    log_format: str = "json"
+    agent_verbose: bool = False
     log_file: str = "trip.json"
+    reservation_store: str = "sqlite"
+    # Defaults to trip.db for the sqlite store and trip.jsonl for the jsonl one.
+    reservation_store_path: str | None = None
+    trip_store_path: str = "trips"
+    agent_mode: str = "react"
+    parallel_tool_calls: bool = True
+    warmup_travel_guide: bool = True
+    fast_paths_enabled: bool = True
+    agent_pool_size: int = 64
+    agent_queue_size: int = 256
+    coalescing_enabled: bool = True
+    coalescing_wait_timeout_seconds: float | None = 120.0
+    tool_executor_workers: int = 16
+    session_token_limit: int = 3000
+    session_idle_seconds: int = 60 * 60
+    max_sessions: int = 10_000
+    session_store_path: str | None = None
+    wikipedia_backend: str = "api"
+    wikipedia_language: str = "en"
+    wikipedia_timeout_seconds: float = 10.0
+    wikipedia_cache_path: str | None = "wikipedia_cache.db"
+    wikipedia_cache_ttl_seconds: int = 7 * 24 * 60 * 60
+    wikipedia_negative_cache_ttl_seconds: int = 24 * 60 * 60
+    wikipedia_token_budget: int = 1500
+    response_cache_enabled: bool = True
+    response_cache_max_entries: int = 1024
+    response_cache_ttl_seconds: int = 24 * 60 * 60
+    response_cache_path: str | None = "response_cache.db"
+    response_cache_similarity_threshold: float | None = None
 
 
 @cache
@@ -0,0 +1,33 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache, partial, wraps
+from typing import Any, Awaitable, Callable
+from ai_assistant.config import get_agent_settings
+from ai_assistant.observability import timed
+
+
+@cache
+def get_tool_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=get_agent_settings().tool_executor_workers,
+        thread_name_prefix="tool",
+    )
+
+
+async def run_blocking(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    # Executor threads do not inherit context variables, and tracing relies on them.
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_tool_executor(), partial(context.run, fn, *args, **kwargs))
+
+
+def to_async(fn: Callable[..., Any]) -> Callable[..., Awaitable[Any]]:
+    """Async variant of a blocking tool function that runs on the bounded tool executor."""
+
+    @wraps(fn)
+    async def async_fn(*args, **kwargs):
+        with timed("tool", fn.__name__):
+            return await run_blocking(fn, *args, **kwargs)
+
+    return async_fn
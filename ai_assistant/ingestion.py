@@ -0,0 +1,131 @@
+import time
+import logging
+import sqlite3
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+from llama_index.core import Document
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode, MetadataMode
+from ai_assistant.retrieval import tag_node
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """Chunk embeddings in SQLite keyed by a hash of the model name and chunk text."""
+
+    def __init__(self, path: str, model_name: str):
+        self.path = path
+        self.model_name = model_name
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\n{text}".encode()).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        with self._connect() as connection:
+            # Stay below SQLite's bound parameter limit.
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                rows = connection.execute(
+                    f"SELECT key, embedding FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+                for key, embedding in rows:
+                    found[key] = np.frombuffer(embedding, dtype=np.float32).tolist()
+        return found
+
+    def set_many(self, embeddings: dict[str, list[float]]):
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                [(key, np.asarray(value, dtype=np.float32).tobytes()) for key, value in embeddings.items()],
+            )
+
+
+def chunk_documents(documents: list[Document]) -> list[BaseNode]:
+    nodes = SentenceSplitter()(documents)
+    for node in nodes:
+        tag_node(node)
+    return nodes
+
+
+class IngestionRunner:
+    """Chunks documents (optionally in several processes) and embeds the chunks in batches.
+
+    Embedding stays in this process so the model is only loaded once; chunks
+    already in the embedding cache are not embedded again.
+    """
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        cache: EmbeddingCache | None = None,
+        batch_size: int = 32,
+        num_workers: int = 1,
+    ):
+        self.embed_model = embed_model
+        self.cache = cache
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+
+    def chunk(self, documents: list[Document]) -> list[BaseNode]:
+        if self.num_workers <= 1 or len(documents) <= 1:
+            return chunk_documents(documents)
+        batches = [documents[i :: self.num_workers] for i in range(self.num_workers)]
+        with ProcessPoolExecutor(self.num_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            return [node for nodes in pool.map(chunk_documents, batches) for node in nodes]
+
+    def run(self, documents: list[Document]) -> list[BaseNode]:
+        start = time.perf_counter()
+        nodes = self.chunk(documents)
+        chunk_seconds = time.perf_counter() - start
+        logger.info(
+            "Chunked %d documents into %d chunks in %.1fs (%.1f chunks/s)",
+            len(documents),
+            len(nodes),
+            chunk_seconds,
+            len(nodes) / max(chunk_seconds, 1e-9),
+        )
+
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        keys = [self.cache.key(text) for text in texts] if self.cache is not None else []
+        cached = self.cache.get_many(keys) if self.cache is not None else {}
+        missing = [i for i in range(len(nodes)) if not keys or keys[i] not in cached]
+
+        start = time.perf_counter()
+        for batch_start in range(0, len(missing), self.batch_size):
+            batch = missing[batch_start : batch_start + self.batch_size]
+            embeddings = self.embed_model.get_text_embedding_batch([texts[i] for i in batch])
+            for i, embedding in zip(batch, embeddings):
+                nodes[i].embedding = embedding
+            if self.cache is not None:
+                self.cache.set_many({keys[i]: nodes[i].embedding for i in batch})
+
+            done = batch_start + len(batch)
+            elapsed = time.perf_counter() - start
+            logger.info("Embedded %d/%d chunks (%.1f chunks/s)", done, len(missing), done / max(elapsed, 1e-9))
+
+        for i, node in enumerate(nodes):
+            if node.embedding is None:
+                node.embedding = cached[keys[i]]
+
+        logger.info("%d of %d chunk embeddings came from the cache", len(nodes) - len(missing), len(nodes))
+        return nodes
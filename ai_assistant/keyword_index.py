@@ -0,0 +1,102 @@
+import re
+import sqlite3
+from contextlib import contextmanager
+from typing import Sequence
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import FilterOperator, MetadataFilters
+from ai_assistant.retrieval import normalize
+
+# Too common to tell chunks apart; dropping them keeps the OR queries short.
+STOPWORDS = {
+    "a", "al", "como", "con", "cual", "de", "del", "donde", "el", "en", "es", "la", "las", "lo", "los",
+    "me", "mi", "para", "por", "que", "se", "su", "un", "una", "y",
+    "an", "and", "are", "at", "for", "in", "is", "of", "on", "or", "the", "to", "what", "where", "with",
+}
+FILTER_COLUMNS = ("city", "category")
+
+
+def query_terms(query: str) -> list[str]:
+    terms = re.findall(r"\w+", normalize(query))
+    return list(dict.fromkeys(term for term in terms if len(term) > 1 and term not in STOPWORDS))
+
+
+class KeywordIndex:
+    """BM25 inverted index of the travel guide chunks, in an SQLite FTS5 table next to the vector index.
+
+    Exact names ("Salar de Uyuni", a restaurant's name) are matched by their
+    terms even when dense retrieval ranks them poorly. Accents are folded, so
+    "Potosí" and "potosi" match.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+                    node_id UNINDEXED, ref_doc_id UNINDEXED, city UNINDEXED, category UNINDEXED, text,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def add(self, nodes: Sequence[BaseNode]):
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT INTO chunks (node_id, ref_doc_id, city, category, text) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        node.node_id,
+                        node.ref_doc_id,
+                        node.metadata.get("city"),
+                        node.metadata.get("category"),
+                        node.get_content(),
+                    )
+                    for node in nodes
+                ],
+            )
+
+    def delete(self, ref_doc_id: str):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM chunks WHERE ref_doc_id = ?", (ref_doc_id,))
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM chunks")
+
+    def count(self) -> int:
+        with self._connect() as connection:
+            return connection.execute("SELECT count(*) FROM chunks").fetchone()[0]
+
+    def search(self, query: str, top_k: int, filters: MetadataFilters | None = None) -> list[tuple[str, float]]:
+        """(node id, BM25 score) of the best matching chunks, higher scores first."""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        where, params = ["chunks MATCH ?"], [" OR ".join(f'"{term}"' for term in terms)]
+        for metadata_filter in filters.filters if filters is not None else []:
+            if metadata_filter.key not in FILTER_COLUMNS or metadata_filter.operator not in (
+                FilterOperator.EQ,
+                FilterOperator.IN,
+            ):
+                raise ValueError(f"Unsupported keyword index filter: {metadata_filter}")
+            values = metadata_filter.value if isinstance(metadata_filter.value, list) else [metadata_filter.value]
+            where.append(f"{metadata_filter.key} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+
+        with self._connect() as connection:
+            rows = connection.execute(
+                # FTS5's bm25() is lower for better matches.
+                f"SELECT node_id, -bm25(chunks) FROM chunks WHERE {' AND '.join(where)} ORDER BY bm25(chunks) LIMIT ?",
+                (*params, top_k),
+            )
+            return rows.fetchall()
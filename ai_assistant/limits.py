@@ -0,0 +1,51 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class OverloadedError(Exception):
+    pass
+
+
+class ConcurrencyLimiter:
+    """Caps concurrent runs and queues a bounded number of waiters; the rest are rejected."""
+
+    def __init__(self, max_concurrent: int, max_queued: int):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def check(self):
+        """Raises OverloadedError if an acquire now would be rejected."""
+        if self._semaphore.locked() and self.waiting >= self.max_queued:
+            self.rejected += 1
+            raise OverloadedError(
+                f"{self.active} requests running and {self.waiting} queued, try again later"
+            )
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.check()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
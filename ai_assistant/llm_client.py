@@ -0,0 +1,325 @@
+"""OpenAI LLM with a shared connection pool, rate limiting, retries, deadlines and a fallback model.
+
+Every call gets a deadline. Within it the primary model is retried with
+jittered exponential backoff on transient errors (connection errors,
+timeouts, 429s and 5xx), then the fallback model, if there is one, gets the
+same treatment. Each attempt first takes its requests and estimated tokens
+from a per-model token bucket, so bursts queue locally instead of running
+into the provider's rate limits. Point OPENAI_API_BASE at
+``python -m ai_assistant.mock_openai`` to exercise all of it offline.
+"""
+
+import time
+import random
+import asyncio
+import logging
+import threading
+from functools import cache
+from typing import Any, Callable, Sequence
+import httpx
+import openai
+from pydantic import Field
+from llama_index.core.base.llms.types import ChatMessage
+from llama_index.llms.openai import OpenAI
+from ai_assistant.budget import count_tokens
+from ai_assistant.config import get_agent_settings
+from ai_assistant.observability import llm_client_events
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    pass
+
+
+class TokenBucket:
+    """Holds up to ``capacity`` units and refills at ``capacity`` per minute; the balance can go negative."""
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.rate = capacity / 60.0
+        self.balance = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.balance = min(self.capacity, self.balance + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        return max(0.0, (amount - self.balance) / self.rate)
+
+
+class RateLimiter:
+    """Requests and tokens per minute as two token buckets.
+
+    Callers reserve up front, going into debt when the buckets are empty, and
+    then sleep until the debt is paid back, so waiters are served in order.
+    """
+
+    def __init__(self, requests_per_minute: int | None, tokens_per_minute: int | None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int, timeout: float) -> float:
+        """Seconds to wait before sending; raises without reserving when that exceeds ``timeout``."""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_for(amount))
+            if wait > timeout:
+                raise LLMDeadlineExceeded(f"Rate limited for {wait:.1f}s, more than the {timeout:.1f}s left")
+            if self.requests is not None:
+                self.requests.balance -= 1
+            if self.tokens is not None:
+                self.tokens.balance -= tokens
+            return wait
+
+    def settle(self, estimated: int, actual: int):
+        """Corrects a reservation made with an estimate once the actual token count is known."""
+        if self.tokens is not None:
+            with self._lock:
+                self.tokens.balance = min(self.tokens.capacity, self.tokens.balance + estimated - actual)
+
+
+@cache
+def get_rate_limiter(model: str) -> RateLimiter:
+    settings = get_agent_settings()
+    return RateLimiter(settings.llm_requests_per_minute, settings.llm_tokens_per_minute)
+
+
+def http_limits() -> httpx.Limits:
+    settings = get_agent_settings()
+    return httpx.Limits(
+        max_connections=settings.llm_max_connections,
+        max_keepalive_connections=settings.llm_max_keepalive_connections,
+    )
+
+
+def http_timeout() -> httpx.Timeout:
+    settings = get_agent_settings()
+    return httpx.Timeout(settings.llm_timeout_seconds, connect=settings.llm_connect_timeout_seconds)
+
+
+# One pool of keep-alive connections per process, shared by every LLM call.
+@cache
+def get_http_client() -> httpx.Client:
+    return httpx.Client(limits=http_limits(), timeout=http_timeout())
+
+
+@cache
+def get_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(limits=http_limits(), timeout=http_timeout())
+
+
+def retry_delay(attempt: int, error: Exception, base: float, cap: float) -> float:
+    """Full jitter exponential backoff, or the server's Retry-After when it sends one."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def estimate_tokens(messages: Sequence[ChatMessage] | str, completion_tokens: int) -> int:
+    if isinstance(messages, str):
+        return count_tokens(messages) + completion_tokens
+    return sum(count_tokens(str(message.content or "")) + 4 for message in messages) + completion_tokens
+
+
+def actual_tokens(response: Any) -> int | None:
+    return getattr(response, "additional_kwargs", {}).get("total_tokens")
+
+
+class ManagedOpenAI(OpenAI):
+    """OpenAI LLM whose requests go through the deadline, retry, rate limit and fallback policy.
+
+    The SDK's and llama_index's own retries are turned off so that this class
+    owns the policy. Streaming calls are retried until their first chunk
+    arrives; after that a failure is the caller's.
+    """
+
+    fallback_model: str | None = Field(default=None, description="Model to use once the primary's attempts fail.")
+    deadline_seconds: float = Field(default=90.0, description="Time for a call, retries and fallback included.")
+    attempts: int = Field(default=3, description="Attempts per model.")
+    retry_base_seconds: float = 0.5
+    retry_max_seconds: float = 8.0
+    completion_token_estimate: int = Field(default=512, description="Tokens reserved for the answer.")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "managed_openai_llm"
+
+    def _models(self) -> list[str]:
+        return [self.model] + ([self.fallback_model] if self.fallback_model else [])
+
+    def _estimate(self, messages: Sequence[ChatMessage] | str) -> int:
+        return estimate_tokens(messages, self.max_tokens or self.completion_token_estimate)
+
+    def _failed(self, error: Exception | None) -> Exception:
+        llm_client_events.inc(model=self.model, event="failed")
+        if error is None or isinstance(error, asyncio.TimeoutError):
+            return LLMDeadlineExceeded(f"No LLM response within {self.deadline_seconds}s")
+        return error
+
+    def _call(self, fn: Callable[..., Any], messages: Sequence[ChatMessage] | str, first: Callable | None, **kwargs):
+        deadline = time.monotonic() + self.deadline_seconds
+        estimate = self._estimate(messages)
+        error: Exception | None = None
+        for model in self._models():
+            limiter = get_rate_limiter(model)
+            if model != self.model:
+                llm_client_events.inc(model=model, event="fallback")
+                logger.warning("Falling back from %s to %s", self.model, model)
+            for attempt in range(self.attempts):
+                if attempt > 0:
+                    delay = retry_delay(attempt - 1, error, self.retry_base_seconds, self.retry_max_seconds)
+                    if time.monotonic() + delay >= deadline:
+                        break
+                    time.sleep(delay)
+                try:
+                    wait = limiter.reserve(estimate, deadline - time.monotonic())
+                except LLMDeadlineExceeded as e:
+                    error = e
+                    break
+                if wait:
+                    llm_client_events.inc(model=model, event="rate_limited")
+                    time.sleep(wait)
+                timeout = min(self.timeout, deadline - time.monotonic())
+                try:
+                    response = fn(messages, **kwargs, model=model, timeout=timeout)
+                    response = first(response) if first is not None else response
+                except RETRYABLE_ERRORS as e:
+                    llm_client_events.inc(model=model, event="retry")
+                    logger.warning("LLM call to %s failed (attempt %d): %r", model, attempt + 1, e)
+                    error = e
+                    continue
+                if (tokens := actual_tokens(response)) is not None:
+                    limiter.settle(estimate, tokens)
+                return response
+        raise self._failed(error)
+
+    async def _acall(
+        self, fn: Callable[..., Any], messages: Sequence[ChatMessage] | str, first: Callable | None, **kwargs
+    ):
+        deadline = time.monotonic() + self.deadline_seconds
+        estimate = self._estimate(messages)
+        error: Exception | None = None
+        for model in self._models():
+            limiter = get_rate_limiter(model)
+            if model != self.model:
+                llm_client_events.inc(model=model, event="fallback")
+                logger.warning("Falling back from %s to %s", self.model, model)
+            for attempt in range(self.attempts):
+                if attempt > 0:
+                    delay = retry_delay(attempt - 1, error, self.retry_base_seconds, self.retry_max_seconds)
+                    if time.monotonic() + delay >= deadline:
+                        break
+                    await asyncio.sleep(delay)
+                try:
+                    wait = limiter.reserve(estimate, deadline - time.monotonic())
+                except LLMDeadlineExceeded as e:
+                    error = e
+                    break
+                if wait:
+                    llm_client_events.inc(model=model, event="rate_limited")
+                    await asyncio.sleep(wait)
+                timeout = min(self.timeout, deadline - time.monotonic())
+
+                async def attempt_call():
+                    response = await fn(messages, **kwargs, model=model, timeout=timeout)
+                    return await first(response) if first is not None else response
+
+                try:
+                    # The HTTP timeout is per read; wait_for bounds the whole attempt.
+                    response = await asyncio.wait_for(attempt_call(), timeout)
+                except (*RETRYABLE_ERRORS, asyncio.TimeoutError) as e:
+                    llm_client_events.inc(model=model, event="retry")
+                    logger.warning("LLM call to %s failed (attempt %d): %r", model, attempt + 1, e)
+                    error = e
+                    continue
+                if (tokens := actual_tokens(response)) is not None:
+                    limiter.settle(estimate, tokens)
+                return response
+        raise self._failed(error)
+
+    @staticmethod
+    def _peek(gen):
+        """Pulls the first chunk so that a failing request raises here, where it can be retried."""
+        try:
+            head = next(gen)
+        except StopIteration:
+            return iter(())
+
+        def chained():
+            yield head
+            yield from gen
+
+        return chained()
+
+    @staticmethod
+    async def _apeek(gen):
+        try:
+            head = await gen.__anext__()
+        except StopAsyncIteration:
+            head = None
+
+        async def chained():
+            if head is not None:
+                yield head
+                async for chunk in gen:
+                    yield chunk
+
+        return chained()
+
+    def _chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return self._call(super()._chat, messages, None, **kwargs)
+
+    def _complete(self, prompt: str, **kwargs: Any):
+        return self._call(super()._complete, prompt, None, **kwargs)
+
+    def _stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return self._call(super()._stream_chat, messages, self._peek, **kwargs)
+
+    def _stream_complete(self, prompt: str, **kwargs: Any):
+        return self._call(super()._stream_complete, prompt, self._peek, **kwargs)
+
+    async def _achat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return await self._acall(super()._achat, messages, None, **kwargs)
+
+    async def _acomplete(self, prompt: str, **kwargs: Any):
+        return await self._acall(super()._acomplete, prompt, None, **kwargs)
+
+    async def _astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return await self._acall(super()._astream_chat, messages, self._apeek, **kwargs)
+
+    async def _astream_complete(self, prompt: str, **kwargs: Any):
+        return await self._acall(super()._astream_complete, prompt, self._apeek, **kwargs)
+
+
+def managed_llm_from_settings() -> ManagedOpenAI:
+    settings = get_agent_settings()
+    return ManagedOpenAI(
+        model=settings.openai_model,
+        api_key=settings.openai_api_key,
+        api_base=settings.openai_api_base,
+        fallback_model=settings.openai_fallback_model,
+        deadline_seconds=settings.llm_deadline_seconds,
+        attempts=settings.llm_attempts,
+        retry_base_seconds=settings.llm_retry_base_seconds,
+        retry_max_seconds=settings.llm_retry_max_seconds,
+        completion_token_estimate=settings.llm_completion_token_estimate,
+        timeout=settings.llm_timeout_seconds,
+        # The policy above does the retrying.
+        max_retries=0,
+        http_client=get_http_client(),
+        async_http_client=get_async_http_client(),
+    )
@@ -0,0 +1,186 @@
+"""Local OpenAI-compatible chat completions server backed by the scripted MockLLM.
+
+Answers like MockLLM (tool calls included) and injects latency, errors,
+rate limits and hangs, to test the managed LLM client without the network:
+
+    python -m ai_assistant.mock_openai --port 8001 --error-rate 0.2 --failing-models gpt-4o-mini
+    OPENAI_API_BASE=http://127.0.0.1:8001/v1 OPENAI_FALLBACK_MODEL=gpt-4o-mini-fallback fastapi dev ai_assistant/api.py
+"""
+
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from dataclasses import dataclass, field
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from llama_index.core.llms import ChatMessage, MessageRole
+from ai_assistant.budget import count_tokens
+from ai_assistant.mocks import MockLLM
+
+
+@dataclass
+class MockServerConfig:
+    latency: float = 0.0
+    tokens_per_second: float | None = None
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    hang_rate: float = 0.0
+    hang_seconds: float = 300.0
+    failing_models: set[str] = field(default_factory=set)
+
+
+config = MockServerConfig()
+rng = random.Random()
+llm = MockLLM()
+stats = {"requests": 0, "errors": 0, "rate_limited": 0, "hangs": 0}
+app = FastAPI(title="Mock OpenAI")
+
+
+def to_chat_messages(messages: list[dict]) -> list[ChatMessage]:
+    """OpenAI message dicts as llama_index messages, with tool results named after their calls."""
+    names = {}
+    chat_messages = []
+    for message in messages:
+        for call in message.get("tool_calls") or []:
+            names[call["id"]] = call["function"]["name"]
+        additional_kwargs = {}
+        if message["role"] == "tool":
+            additional_kwargs = {"name": names.get(message.get("tool_call_id")), "tool_call_id": message.get("tool_call_id")}
+        content = message.get("content")
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content)
+        chat_messages.append(
+            ChatMessage(role=MessageRole(message["role"]), content=content, additional_kwargs=additional_kwargs)
+        )
+    return chat_messages
+
+
+def respond(body: dict) -> tuple[str, list[dict]]:
+    messages = to_chat_messages(body["messages"])
+    tools = [tool["function"]["name"] for tool in body.get("tools") or []]
+    if tools:
+        message = llm.respond_with_tools(messages, tools, body.get("parallel_tool_calls", True))
+        calls = [
+            {
+                "id": call["id"],
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call["arguments"], ensure_ascii=False)},
+            }
+            for call in message.additional_kwargs.get("tool_calls", [])
+        ]
+        return str(message.content or ""), calls
+    return llm.respond(llm.messages_to_prompt(messages)), []
+
+
+def error(status: int, message: str, kind: str, headers: dict | None = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status, content={"error": {"message": message, "type": kind, "code": None}}, headers=headers
+    )
+
+
+@app.get("/v1/models")
+def models():
+    return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]}
+
+
+@app.get("/stats")
+def server_stats():
+    return stats
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "mock")
+    stats["requests"] += 1
+
+    await asyncio.sleep(config.latency)
+    if model in config.failing_models or rng.random() < config.error_rate:
+        stats["errors"] += 1
+        return error(503, f"The model {model} is overloaded", "server_error")
+    if rng.random() < config.rate_limit_rate:
+        stats["rate_limited"] += 1
+        return error(429, "Rate limit reached", "rate_limit_error", headers={"Retry-After": "0.1"})
+    if rng.random() < config.hang_rate:
+        stats["hangs"] += 1
+        await asyncio.sleep(config.hang_seconds)
+
+    content, tool_calls = respond(body)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    usage = {
+        "prompt_tokens": sum(count_tokens(str(message.get("content") or "")) for message in body["messages"]),
+        "completion_tokens": count_tokens(content) + 20 * len(tool_calls),
+    }
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+    if not body.get("stream"):
+        message = {"role": "assistant", "content": content or None}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop", "logprobs": None}
+            ],
+            "usage": usage,
+        }
+
+    def chunk(delta: dict, finish_reason: str | None = None) -> str:
+        data = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(data)}\n\n"
+
+    async def events():
+        yield chunk({"role": "assistant", "content": ""})
+        for position, call in enumerate(tool_calls):
+            yield chunk({"tool_calls": [{"index": position, **call}]})
+        for text in llm._chunks(content):
+            if config.tokens_per_second:
+                await asyncio.sleep(1.0 / config.tokens_per_second)
+            yield chunk({"content": text})
+        yield chunk({}, "tool_calls" if tool_calls else "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before every response.")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Streaming speed.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with a 503.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests failing with a 429.")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests that stall.")
+    parser.add_argument("--hang-seconds", type=float, default=300.0)
+    parser.add_argument("--failing-models", nargs="*", default=[], help="Models that always fail with a 503.")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config.latency = args.latency
+    config.tokens_per_second = args.tokens_per_second
+    config.error_rate = args.error_rate
+    config.rate_limit_rate = args.rate_limit_rate
+    config.hang_rate = args.hang_rate
+    config.hang_seconds = args.hang_seconds
+    config.failing_models = set(args.failing_models)
+    rng.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Deterministic local stand-ins for the LLM, the embedding model and Wikipedia.
+
+Selected with LLM_BACKEND=mock, EMBEDDINGS_BACKEND=mock and
+WIKIPEDIA_BACKEND=static, so the agent can run (and be benchmarked) without
+network access or an API key.
+"""
+
+import re
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+from typing import Any, Sequence
+import numpy as np
+from pydantic import Field
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.generic_utils import (
+    astream_completion_response_to_chat_response,
+    completion_response_to_chat_response,
+)
+from llama_index.core.llms import (
+    ChatMessage,
+    ChatResponse,
+    CompletionResponse,
+    CustomLLM,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.function_calling import FunctionCallingLLM
+from llama_index.core.llms.llm import ToolSelection
+from ai_assistant.wikipedia import WikiPage
+
+MOCK_ANSWER = (
+    "Ciudad: Sucre\n"
+    "- Lugares para visitar: Plaza 25 de Mayo, Casa de la Libertad, Recoleta\n"
+    "- Duracion de Estadía Sugerida: 3 días\n"
+    "- Restaurantes: El Huerto, cocina boliviana tradicional\n"
+    "- Hoteles: Hotel Parador Santa María la Real, casona colonial en el centro\n"
+    "- Actividades: caminata al Cráter de Maragua, visita al Parque Cretácico"
+)
+
+BOOKINGS = (
+    (r"vuelo|flight", "reserve_flight", {"origin": "La Paz", "destination": "Sucre", "date_str": "2025-06-01"}),
+    (
+        r"hotel",
+        "reserve_hotel",
+        {"checkin_str": "2025-06-01", "checkout_str": "2025-06-04", "hotel_name": "Parador", "city": "Sucre"},
+    ),
+    (r"bus", "reserve_bus", {"date_str": "2025-06-04", "origin": "Sucre", "destination": "Potosí"}),
+    (
+        r"restaurante|cena|dinner|restaurant",
+        "reserve_restaurant",
+        {"reservation_time_str": "2025-06-02T20:00:00", "restaurant": "El Huerto", "city": "Sucre"},
+    ),
+)
+
+
+def plan_tool_calls(message: str) -> list[tuple[str, dict]]:
+    """The tool calls a request needs: one per booking it mentions, else the trip summary or the guide."""
+    bookings = [
+        (tool, arguments) for pattern, tool, arguments in BOOKINGS if re.search(pattern, message, re.IGNORECASE)
+    ]
+    if re.search(r"reserva|book", message, re.IGNORECASE) and bookings:
+        return bookings
+    if re.search(r"trip|viaje|summary|resumen", message, re.IGNORECASE):
+        return [("trip_summary", {"detailed": False})]
+    query = " ".join(message.split())[:200]
+    return [("travel_guide", {"input": query})]
+
+
+class MockLLM(CustomLLM, FunctionCallingLLM):
+    """Scripted agent LLM with configurable latency.
+
+    In the agent loop it makes one reservation per booking the user's message
+    mentions, calls ``trip_summary`` for questions about the trip and
+    ``travel_guide`` otherwise, then answers once every call has a result.
+    With ReAct prompts that is one call per LLM round trip; with function
+    calling all of them come in one turn, or one per turn when parallel tool
+    calls are off. Any other prompt (query engine synthesis, reports) gets a
+    fixed answer.
+    """
+
+    latency: float = Field(default=0.0, description="Seconds before the first token.")
+    tokens_per_second: float | None = Field(default=None, description="Streaming speed, None for instant.")
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            model_name="mock",
+            is_chat_model=False,
+            is_function_calling_model=True,
+            context_window=128_000,
+            num_output=1024,
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MockLLM"
+
+    def respond(self, prompt: str) -> str:
+        if "Action Input" not in prompt:
+            return MOCK_ANSWER
+
+        # The user's request is the last user message that is not an observation.
+        turns = prompt.split("\nuser: ")
+        position = max(i for i, turn in enumerate(turns) if i == 0 or not turn.startswith("Observation:"))
+        request = turns[position].split("\nassistant: ", 1)[0]
+        done = re.findall(r"^Action: (\w+)", "\nuser: ".join(turns[position:]), re.MULTILINE)
+
+        pending = [call for call in plan_tool_calls(request) if call[0] not in done]
+        if not pending:
+            return f"Thought: I can answer without using any more tools.\nAnswer: {MOCK_ANSWER}"
+        tool, arguments = pending[0]
+        return f"Thought: I need to use {tool}.\nAction: {tool}\nAction Input: {json.dumps(arguments, ensure_ascii=False)}"
+
+    def _prepare_chat_with_tools(
+        self,
+        tools: Sequence[Any],
+        user_msg: str | ChatMessage | None = None,
+        chat_history: list[ChatMessage] | None = None,
+        verbose: bool = False,
+        allow_parallel_tool_calls: bool = False,
+        **kwargs: Any,
+    ) -> dict[str, Any]:
+        messages = list(chat_history or [])
+        if isinstance(user_msg, str):
+            user_msg = ChatMessage(role=MessageRole.USER, content=user_msg)
+        if user_msg is not None:
+            messages.append(user_msg)
+        return {
+            "messages": messages,
+            "tools": [tool.metadata.name for tool in tools],
+            "allow_parallel_tool_calls": allow_parallel_tool_calls,
+            **kwargs,
+        }
+
+    def respond_with_tools(self, messages: Sequence[ChatMessage], tools: list[str], parallel: bool) -> ChatMessage:
+        position = max(
+            (i for i, message in enumerate(messages) if message.role == MessageRole.USER), default=0
+        )
+        done = {message.additional_kwargs.get("name") for message in messages[position:] if message.role == MessageRole.TOOL}
+        pending = [
+            call for call in plan_tool_calls(str(messages[position].content)) if call[0] in tools and call[0] not in done
+        ]
+        if not pending:
+            return ChatMessage(role=MessageRole.ASSISTANT, content=MOCK_ANSWER)
+        calls = [
+            {"id": uuid.uuid4().hex, "name": tool, "arguments": arguments}
+            for tool, arguments in (pending if parallel else pending[:1])
+        ]
+        return ChatMessage(role=MessageRole.ASSISTANT, content="", additional_kwargs={"tool_calls": calls})
+
+    def get_tool_calls_from_response(
+        self, response: ChatResponse, error_on_no_tool_call: bool = True, **kwargs: Any
+    ) -> list[ToolSelection]:
+        calls = response.message.additional_kwargs.get("tool_calls", [])
+        if not calls and error_on_no_tool_call:
+            raise ValueError("Expected at least one tool call.")
+        return [ToolSelection(tool_id=call["id"], tool_name=call["name"], tool_kwargs=call["arguments"]) for call in calls]
+
+    def _chunks(self, text: str) -> list[str]:
+        return re.findall(r"\S+\s*", text)
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        text = self.respond(prompt)
+        time.sleep(self.latency + self._token_delay() * len(self._chunks(text)))
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        text = self.respond(prompt)
+        await asyncio.sleep(self.latency + self._token_delay() * len(self._chunks(text)))
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        text = self.respond(prompt)
+
+        def gen():
+            time.sleep(self.latency)
+            response = ""
+            for chunk in self._chunks(text):
+                time.sleep(self._token_delay())
+                response += chunk
+                yield CompletionResponse(text=response, delta=chunk)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        text = self.respond(prompt)
+
+        async def gen():
+            await asyncio.sleep(self.latency)
+            response = ""
+            for chunk in self._chunks(text):
+                await asyncio.sleep(self._token_delay())
+                response += chunk
+                yield CompletionResponse(text=response, delta=chunk)
+
+        return gen()
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        if "tools" in kwargs:
+            time.sleep(self.latency)
+            return ChatResponse(
+                message=self.respond_with_tools(messages, kwargs["tools"], kwargs["allow_parallel_tool_calls"])
+            )
+        return completion_response_to_chat_response(self.complete(self.messages_to_prompt(messages), formatted=True))
+
+    # CustomLLM's async chat methods call the blocking ones; these keep the event loop free.
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        if "tools" in kwargs:
+            await asyncio.sleep(self.latency)
+            return ChatResponse(
+                message=self.respond_with_tools(messages, kwargs["tools"], kwargs["allow_parallel_tool_calls"])
+            )
+        prompt = self.messages_to_prompt(messages)
+        return completion_response_to_chat_response(await self.acomplete(prompt, formatted=True))
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        prompt = self.messages_to_prompt(messages)
+        return astream_completion_response_to_chat_response(await self.astream_complete(prompt, formatted=True))
+
+
+class HashEmbedding(BaseEmbedding):
+    """Bag-of-words feature hashing: texts sharing words get similar vectors, with no model to load."""
+
+    embed_dim: int = 384
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.embed_dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+            vector[digest % self.embed_dim] += 1.0 if digest & (1 << 63) else -1.0
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+STATIC_WIKIPEDIA_PAGES = {
+    city: WikiPage(
+        title=city,
+        summary=f"{city} es una ciudad de Bolivia.",
+        sections=[
+            ("Historia", f"La historia de {city} se remonta a la época colonial."),
+            ("Turismo", f"{city} ofrece museos, plazas, mercados y excursiones a los alrededores."),
+            ("Clima", f"El clima de {city} varía según la altitud y la estación."),
+        ],
+    )
+    for city in ("La Paz", "Sucre", "Potosí", "Cochabamba", "Santa Cruz", "Uyuni", "Oruro", "Tarija")
+}
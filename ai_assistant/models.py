@@ -1,7 +1,11 @@
 from pydantic import BaseModel, Field
 from enum import Enum
 from datetime import date, datetime
-from typing import Optional
+from typing import Annotated, Literal, Optional, Union
+
+
+# Trip ids name the trip's partition of the reservation store, so they are kept filename-safe.
+TRIP_ID_PATTERN = r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$"
 
 
 class TripType(str, Enum):
@@ -9,7 +13,14 @@ class TripType(str, Enum):
     bus = "BUS"
 
 
-class TripReservation(BaseModel):
+class TripRecord(BaseModel):
+    """The trip a reservation belongs to and the user who made it; None for the shared legacy log."""
+
+    trip_id: Optional[str] = Field(None, pattern=TRIP_ID_PATTERN)
+    user_id: Optional[str] = Field(None)
+
+
+class TripReservation(TripRecord):
     trip_type: TripType
     date: date
     departure: str
@@ -17,7 +28,7 @@ class TripReservation(BaseModel):
     cost: int
 
 
-class HotelReservation(BaseModel):
+class HotelReservation(TripRecord):
     checkin_date: date
     checkout_date: date
     hotel_name: str
@@ -25,7 +36,7 @@ class HotelReservation(BaseModel):
     cost: int
 
 
-class RestaurantReservation(BaseModel):
+class RestaurantReservation(TripRecord):
     reservation_time: datetime
     restaurant: str
     city: str
@@ -33,11 +44,44 @@ class RestaurantReservation(BaseModel):
     cost: int
 
 
+class ReservationAggregate(BaseModel):
+    count: int = 0
+    cost: int = 0
+    first_date: str | None = None
+    last_date: str | None = None
+
+
+class TripSummary(BaseModel):
+    cities: dict[str, dict[str, ReservationAggregate]] = Field(default_factory=dict)
+    total_reservations: int = 0
+    total_cost: int = 0
+
+    def add(self, city: str, reservation_type: str, reservation_date: str, cost: int):
+        aggregate = self.cities.setdefault(city, {}).setdefault(
+            reservation_type, ReservationAggregate()
+        )
+        aggregate.count += 1
+        aggregate.cost += cost
+        aggregate.first_date = min(filter(None, [aggregate.first_date, reservation_date]))
+        aggregate.last_date = max(filter(None, [aggregate.last_date, reservation_date]))
+        self.total_reservations += 1
+        self.total_cost += cost
+
+
 class AgentAPIResponse(BaseModel):
     status: str
     agent_response: str
     timestamp: datetime = Field(default_factory=datetime.now)
 
+class ChatRequest(BaseModel):
+    message: str
+    session_id: Optional[str] = Field(None)
+    trip_id: Optional[str] = Field(None, pattern=TRIP_ID_PATTERN)
+    user_id: Optional[str] = Field(None)
+
+class ChatResponse(AgentAPIResponse):
+    session_id: str
+
 class RecommendationRequest(BaseModel):
     object: str
     notes: Optional[list[str]] = Field(None)
@@ -58,4 +102,32 @@ class RestaurantReservationRequest(BaseModel):
     time: str
     restaurant: str
     city: str
-    dish: Optional[str] = Field(None)
\ No newline at end of file
+    dish: Optional[str] = Field(None)
+
+class FlightItineraryItem(ReservationRequest):
+    type: Literal["flight"]
+
+class BusItineraryItem(ReservationRequest):
+    type: Literal["bus"]
+
+class HotelItineraryItem(HotelReservationRequest):
+    type: Literal["hotel"]
+
+class RestaurantItineraryItem(RestaurantReservationRequest):
+    type: Literal["restaurant"]
+
+ItineraryItem = Annotated[
+    Union[FlightItineraryItem, BusItineraryItem, HotelItineraryItem, RestaurantItineraryItem],
+    Field(discriminator="type"),
+]
+
+class ItineraryRequest(BaseModel):
+    reservations: list[ItineraryItem] = Field(min_length=1)
+    trip_id: Optional[str] = Field(None, pattern=TRIP_ID_PATTERN)
+    user_id: Optional[str] = Field(None)
+
+class ItineraryResponse(BaseModel):
+    status: str
+    reservations: list[TripReservation | HotelReservation | RestaurantReservation]
+    total_cost: int
+    timestamp: datetime = Field(default_factory=datetime.now)
@@ -0,0 +1,287 @@
+import json
+import time
+import logging
+import inspect
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import cache
+from typing import Any
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.base import BaseLLM
+from llama_index.core.agent.types import BaseAgentWorker
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events import BaseEvent
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent, LLMCompletionEndEvent
+from llama_index.core.instrumentation.span import BaseSpan
+from llama_index.core.instrumentation.span_handlers import BaseSpanHandler
+from llama_index.core.utils import get_tokenizer
+from ai_assistant.budget import prompt_components
+from ai_assistant.config import get_agent_settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RequestTrace:
+    request_id: str
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    tool_calls: int = 0
+    prompt_components: dict[str, int] = field(default_factory=dict)
+
+
+# The trace of the request being served; run_blocking copies it into executor threads.
+current_trace: ContextVar[RequestTrace | None] = ContextVar("current_trace", default=None)
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_labels(labels: tuple[tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), counts):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{format_labels(labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {cumulative}")
+        return lines
+
+
+http_request_duration = Histogram("http_request_duration_seconds", "HTTP request latency.")
+span_duration = Histogram("agent_span_duration_seconds", "Latency of LLM calls, tools, retrieval and embedding.")
+llm_tokens = Counter("llm_tokens_total", "Prompt and completion tokens sent to and received from the LLM.")
+llm_prompt_tokens = Counter(
+    "llm_prompt_component_tokens_total",
+    "Agent prompt tokens by component: system, tools, history, user, reasoning and observations.",
+)
+coalesced_requests = Counter(
+    "agent_coalesced_requests_total",
+    "Agent requests that ran, shared an identical in-flight run or timed out waiting for one.",
+)
+llm_client_events = Counter(
+    "llm_client_events_total",
+    "LLM client retries, fallbacks, rate limiter waits and calls that failed after all of them.",
+)
+METRICS = (http_request_duration, span_duration, llm_tokens, llm_prompt_tokens, coalesced_requests, llm_client_events)
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+def record_span(kind: str, name: str, seconds: float):
+    span_duration.observe(seconds, kind=kind, name=name)
+    trace = current_trace.get()
+    if kind == "tool" and trace is not None:
+        trace.tool_calls += 1
+    logger.debug("span", extra={"kind": kind, "span": name, "duration_ms": round(seconds * 1000, 2)})
+
+
+@contextmanager
+def timed(kind: str, name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(kind, name, time.perf_counter() - start)
+
+
+LLM_METHODS = {"chat", "achat", "complete", "acomplete", "stream_chat", "astream_chat", "stream_complete", "astream_complete"}
+EMBEDDING_METHODS = {"get_query_embedding", "aget_query_embedding", "get_text_embedding_batch", "aget_text_embedding_batch"}
+SPAN_KINDS = (
+    (BaseLLM, "llm", LLM_METHODS),
+    (BaseEmbedding, "embedding", EMBEDDING_METHODS),
+    (BaseRetriever, "retrieval", {"retrieve", "aretrieve"}),
+    (BaseQueryEngine, "query", {"query", "aquery"}),
+    (BaseAgentWorker, "agent_step", {"run_step", "arun_step", "stream_step", "astream_step"}),
+)
+
+
+def span_kind(id_: str, instance: Any) -> str | None:
+    # Span ids are "<qualname>-<uuid>".
+    method = id_.split("-", 1)[0].rsplit(".", 1)[-1]
+    for cls, kind, methods in SPAN_KINDS:
+        if isinstance(instance, cls) and method in methods:
+            return kind
+    return None
+
+
+class TimingSpan(BaseSpan):
+    kind: str
+    name: str
+    started: float
+
+
+class TimingSpanHandler(BaseSpanHandler[TimingSpan]):
+    """Times the llama_index spans that matter for latency: LLM, embedding, retrieval, query and agent steps."""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TimingSpanHandler"
+
+    def new_span(
+        self,
+        id_: str,
+        bound_args: inspect.BoundArguments,
+        instance: Any | None = None,
+        parent_span_id: str | None = None,
+        tags: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> TimingSpan | None:
+        kind = span_kind(id_, instance)
+        if kind is None:
+            return None
+        return TimingSpan(
+            id_=id_, parent_id=parent_span_id, kind=kind, name=type(instance).__name__, started=time.perf_counter()
+        )
+
+    def prepare_to_exit_span(
+        self,
+        id_: str,
+        bound_args: inspect.BoundArguments,
+        instance: Any | None = None,
+        result: Any | None = None,
+        **kwargs: Any,
+    ) -> TimingSpan | None:
+        span = self.open_spans.get(id_)
+        if span is not None:
+            record_span(span.kind, span.name, time.perf_counter() - span.started)
+        return span
+
+    def prepare_to_drop_span(
+        self,
+        id_: str,
+        bound_args: inspect.BoundArguments,
+        instance: Any | None = None,
+        err: BaseException | None = None,
+        **kwargs: Any,
+    ) -> TimingSpan | None:
+        return self.prepare_to_exit_span(id_, bound_args, instance)
+
+
+class TokenCountingEventHandler(BaseEventHandler):
+    """Counts LLM calls and tokens, from the provider's usage when it reports it."""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TokenCountingEventHandler"
+
+    def handle(self, event: BaseEvent, **kwargs: Any) -> None:
+        if isinstance(event, LLMChatEndEvent):
+            components = prompt_components(event.messages)
+        elif isinstance(event, LLMCompletionEndEvent):
+            components = {"prompt": len(get_tokenizer()(event.prompt))}
+        else:
+            return
+        if event.response is None:
+            return
+
+        usage = getattr(event.response, "additional_kwargs", None) or {}
+        prompt_tokens = usage.get("prompt_tokens") or sum(components.values())
+        completion_tokens = usage.get("completion_tokens") or len(get_tokenizer()(str(event.response)))
+        llm_tokens.inc(prompt_tokens, type="prompt")
+        llm_tokens.inc(completion_tokens, type="completion")
+        for component, tokens in components.items():
+            llm_prompt_tokens.inc(tokens, component=component)
+        logger.debug("llm_call", extra={"prompt_components": components, "completion_tokens": completion_tokens})
+
+        trace = current_trace.get()
+        if trace is not None:
+            trace.llm_calls += 1
+            trace.prompt_tokens += prompt_tokens
+            trace.completion_tokens += completion_tokens
+            for component, tokens in components.items():
+                trace.prompt_components[component] = trace.prompt_components.get(component, 0) + tokens
+
+
+class JsonFormatter(logging.Formatter):
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace = current_trace.get()
+        if trace is not None:
+            entry["request_id"] = trace.request_id
+        entry.update({key: value for key, value in vars(record).items() if key not in self.RESERVED})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+@cache
+def configure_logging():
+    settings = get_agent_settings()
+    handler = logging.StreamHandler()
+    if settings.log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    package_logger = logging.getLogger("ai_assistant")
+    package_logger.addHandler(handler)
+    package_logger.setLevel(settings.log_level.upper())
+    package_logger.propagate = False
+
+
+@cache
+def instrument():
+    dispatcher = get_dispatcher()
+    dispatcher.add_span_handler(TimingSpanHandler())
+    dispatcher.add_event_handler(TokenCountingEventHandler())
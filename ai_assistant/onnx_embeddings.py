@@ -0,0 +1,284 @@
+"""ONNX Runtime backend for the sentence embedding model, with int8 dynamic quantization.
+
+Export the model once, then select it with EMBEDDINGS_BACKEND=onnx:
+
+    python -m ai_assistant.onnx_embeddings export --output onnx_model
+    python -m ai_assistant.onnx_embeddings parity
+    python -m ai_assistant.onnx_embeddings benchmark
+
+Needs onnxruntime; exporting also needs torch and transformers, which the
+HuggingFace backend already installs.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import Any
+import numpy as np
+from pydantic import Field, PrivateAttr
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from ai_assistant.config import get_agent_settings
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+
+
+def instructions_for(model_name: str) -> tuple[str, str]:
+    """Query and passage prefixes, the same ones HuggingFaceEmbedding adds for the model."""
+    if "e5" in model_name.lower():
+        return "query: ", "passage: "
+    return "", ""
+
+
+def export_model(model_name: str, output_dir: str, quantize: bool = True) -> str:
+    """Exports the model's encoder to ONNX and, by default, an int8 dynamically quantized copy."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["query: hoteles en Sucre"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+    with open(os.path.join(output_dir, "export.json"), "w") as file:
+        json.dump({"model_name": model_name}, file)
+
+    if not quantize:
+        return fp32_path
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = os.path.join(output_dir, INT8_FILE)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+class OnnxEmbedding(BaseEmbedding):
+    """Mean-pooled, normalized sentence embeddings from an exported model, like HuggingFaceEmbedding's."""
+
+    model_path: str = Field(description="Directory written by export_model.")
+    quantized: bool = Field(default=True, description="Use the int8 model instead of the float32 one.")
+    num_threads: int | None = Field(default=None, description="ONNX Runtime intra-op threads, None for all cores.")
+    max_length: int = Field(default=512, description="Tokens per text; longer texts are truncated.")
+    query_instruction: str = ""
+    text_instruction: str = ""
+
+    _session: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+    _input_names: list[str] = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads is not None:
+            options.intra_op_num_threads = self.num_threads
+            options.inter_op_num_threads = 1
+        model_file = os.path.join(self.model_path, INT8_FILE if self.quantized else FP32_FILE)
+        self._session = onnxruntime.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self._input_names = [model_input.name for model_input in self._session.get_inputs()]
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxEmbedding"
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        encoded = self._tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+        )
+        inputs = {name: encoded[name].astype(np.int64) for name in self._input_names}
+        hidden = self._session.run(None, inputs)[0]
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.tolist()
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._embed([self.query_instruction + query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._embed([self.text_instruction + text])[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._embed([self.text_instruction + text for text in texts])
+
+
+def onnx_embedding_from_settings() -> OnnxEmbedding:
+    settings = get_agent_settings()
+    query_instruction, text_instruction = instructions_for(settings.hf_embeddings_model)
+    return OnnxEmbedding(
+        # Quantized vectors differ slightly, so they are cached under their own name.
+        model_name=f"{settings.hf_embeddings_model}:onnx-{'int8' if settings.onnx_quantized else 'fp32'}",
+        model_path=settings.onnx_model_path,
+        quantized=settings.onnx_quantized,
+        num_threads=settings.onnx_threads,
+        max_length=settings.onnx_max_length,
+        query_instruction=query_instruction,
+        text_instruction=text_instruction,
+        embed_batch_size=settings.embed_batch_size,
+    )
+
+
+def huggingface_embedding_from_settings() -> BaseEmbedding:
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    settings = get_agent_settings()
+    return HuggingFaceEmbedding(model_name=settings.hf_embeddings_model, embed_batch_size=settings.embed_batch_size)
+
+
+def sample_texts(limit: int) -> list[str]:
+    """Chunks of the travel guide data, as ingestion would embed them."""
+    from llama_index.core import SimpleDirectoryReader
+    from llama_index.core.schema import MetadataMode
+    from ai_assistant.ingestion import chunk_documents
+
+    documents = SimpleDirectoryReader(get_agent_settings().travel_guide_data_path, recursive=True).load_data()
+    return [node.get_content(metadata_mode=MetadataMode.EMBED) for node in chunk_documents(documents)[:limit]]
+
+
+PARITY_QUERIES = [
+    "hoteles en Sucre",
+    "restaurantes de comida típica en La Paz",
+    "qué hacer en el Salar de Uyuni",
+    "museos coloniales en Potosí",
+    "festivales en Oruro",
+    "excursiones desde Cochabamba",
+    "vinos y bodegas de Tarija",
+    "parques nacionales cerca de Santa Cruz",
+]
+
+
+def parity(limit: int, top_k: int) -> dict:
+    """Compares the ONNX embeddings with the HuggingFace ones on the travel guide.
+
+    Reports the cosine similarity between the two embeddings of each chunk and
+    query, and how many of the HuggingFace top-k chunks for each query the
+    ONNX embeddings also retrieve.
+    """
+    texts = sample_texts(limit)
+    reference, candidate = huggingface_embedding_from_settings(), onnx_embedding_from_settings()
+
+    reference_texts = np.array(reference.get_text_embedding_batch(texts))
+    candidate_texts = np.array(candidate.get_text_embedding_batch(texts))
+    reference_queries = np.array([reference.get_query_embedding(query) for query in PARITY_QUERIES])
+    candidate_queries = np.array([candidate.get_query_embedding(query) for query in PARITY_QUERIES])
+
+    text_cosines = (reference_texts * candidate_texts).sum(axis=1)
+    query_cosines = (reference_queries * candidate_queries).sum(axis=1)
+    k = min(top_k, len(texts))
+    reference_top = np.argsort(-(reference_queries @ reference_texts.T), axis=1)[:, :k]
+    candidate_top = np.argsort(-(candidate_queries @ candidate_texts.T), axis=1)[:, :k]
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(reference_top, candidate_top)]
+    return {
+        "texts": len(texts),
+        "text_cosine_min": round(float(text_cosines.min()), 4),
+        "text_cosine_mean": round(float(text_cosines.mean()), 4),
+        "query_cosine_min": round(float(query_cosines.min()), 4),
+        f"top{k}_overlap_mean": round(float(np.mean(overlap)), 4),
+    }
+
+
+def measure(backend: str, limit: int, repeats: int) -> dict:
+    """Throughput and peak RSS of one backend; run in its own process so RSS is not shared."""
+    import resource
+
+    start = time.perf_counter()
+    model = onnx_embedding_from_settings() if backend == "onnx" else huggingface_embedding_from_settings()
+    load_seconds = time.perf_counter() - start
+    texts = sample_texts(limit)
+    model.get_text_embedding_batch(texts[: model.embed_batch_size])
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.get_text_embedding_batch(texts)
+    batch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for query in PARITY_QUERIES * repeats:
+        model.get_query_embedding(query)
+    query_seconds = time.perf_counter() - start
+
+    return {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 2),
+        "texts_per_second": round(len(texts) * repeats / batch_seconds, 1),
+        "query_ms": round(query_seconds * 1000 / (len(PARITY_QUERIES) * repeats), 2),
+        # ru_maxrss is in kilobytes on Linux.
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def benchmark(limit: int, repeats: int) -> list[dict]:
+    results = []
+    for backend in ("huggingface", "onnx"):
+        command = [sys.executable, "-m", "ai_assistant.onnx_embeddings", "measure", backend]
+        output = subprocess.run(
+            [*command, "--limit", str(limit), "--repeats", str(repeats)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Export the embedding model to ONNX and quantize it.")
+    export.add_argument("--model", default=get_agent_settings().hf_embeddings_model)
+    export.add_argument("--output", default=get_agent_settings().onnx_model_path)
+    export.add_argument("--no-quantize", action="store_true")
+
+    check = commands.add_parser("parity", help="Compare the ONNX embeddings with the HuggingFace ones.")
+    check.add_argument("--limit", type=int, default=500, help="Travel guide chunks to embed.")
+    check.add_argument("--top-k", type=int, default=4)
+
+    bench = commands.add_parser("benchmark", help="Compare throughput and memory of both backends.")
+    bench.add_argument("--limit", type=int, default=256)
+    bench.add_argument("--repeats", type=int, default=3)
+
+    one = commands.add_parser("measure")
+    one.add_argument("backend", choices=["huggingface", "onnx"])
+    one.add_argument("--limit", type=int, default=256)
+    one.add_argument("--repeats", type=int, default=3)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        print(export_model(args.model, args.output, quantize=not args.no_quantize))
+    elif args.command == "parity":
+        print(json.dumps(parity(args.limit, args.top_k), indent=2))
+    elif args.command == "benchmark":
+        for result in benchmark(args.limit, args.repeats):
+            print(json.dumps(result))
+    else:
+        print(json.dumps(measure(args.backend, args.limit, args.repeats)))
+
+
+if __name__ == "__main__":
+    main()
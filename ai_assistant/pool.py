@@ -0,0 +1,52 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from functools import cache
+from llama_index.core import PromptTemplate
+from llama_index.core.agent import AgentRunner
+from ai_assistant.agent import TravelAgent
+from ai_assistant.config import get_agent_settings
+from ai_assistant.prompts import agent_prompt_tpl
+
+
+class AgentPool:
+    def __init__(self, size: int, system_prompt: PromptTemplate | None = None):
+        self.size = size
+        self._agents: asyncio.Queue[AgentRunner] = asyncio.Queue(maxsize=size)
+        for _ in range(size):
+            self._agents.put_nowait(TravelAgent(system_prompt).get_agent())
+
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def checkout(self):
+        start = time.perf_counter()
+        agent = await self._agents.get()
+        self._record_wait(time.perf_counter() - start)
+        try:
+            yield agent
+        finally:
+            # Chat memory must not leak into the next request using this agent.
+            agent.reset()
+            self._agents.put_nowait(agent)
+
+    def _record_wait(self, wait: float):
+        self.checkouts += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "available": self._agents.qsize(),
+            "checkouts": self.checkouts,
+            "avg_checkout_wait_seconds": self.total_wait / self.checkouts if self.checkouts else 0.0,
+            "max_checkout_wait_seconds": self.max_wait,
+        }
+
+
+@cache
+def get_agent_pool() -> AgentPool:
+    return AgentPool(get_agent_settings().agent_pool_size, agent_prompt_tpl)
@@ -1,4 +1,5 @@
 from llama_index.core import PromptTemplate
+from ai_assistant.budget import compact_prompt
 
 travel_guide_description = """
     A tool providing recommendations and travel advice for Bolivia. Input is a plain text query asking 
@@ -97,5 +98,49 @@ agent_prompt_str = """
     Below is the current conversation consisting of interleaving human and assistant messages.
 """
 
-travel_guide_qa_tpl = PromptTemplate(travel_guide_qa_str)
-agent_prompt_tpl = PromptTemplate(agent_prompt_str)
+function_calling_agent_prompt_str = """
+    You are designed to assist users with travel planning in Bolivia. Your task is to provide detailed and personalized recommendations, including places to visit, restaurants, hotels, and travel advice, such as how long to stay in specific locations and the best times to visit.
+
+    Use the tools you are given to retrieve information about Bolivia and to make flight, bus, hotel and restaurant reservations.
+    When a request needs several independent tool calls, such as booking a flight, a hotel and a restaurant, call all of them at once instead of one at a time.
+    Only wait for a tool result before the next call when the next call depends on it.
+
+    Always answer in the same language as the user's question, which is usually **Spanish**.
+"""
+
+trip_report_prompt = """
+    Please generate a trip summary using the tool `trip_summary_tool`.
+    After generating the trip summary, analyze it and generate a detailed report.
+
+    The detailed report should include:
+    1. Key highlights of the trip.
+    2. Any identified issues or recommendations.
+    3. Additional insights based on the generated trip summary.
+
+    Use the `trip_summary_tool` to create the summary as the first step, then follow with the report.
+
+    Please include both the trip summary and the detailed report in **Spanish** in your **final Answer**.
+    Make sure to return both the summary and the detailed report as part of the final **Answer**, and not as internal thoughts or reasoning.
+"""
+
+trip_report_synthesis_str = """
+    You are an expert travel guide for Bolivia. Below is the summary of the user's trip, generated from their reservations.
+    ---------------------
+    {trip_summary}
+    ---------------------
+
+    Analyze the trip summary and generate a detailed report.
+
+    The detailed report should include:
+    1. Key highlights of the trip.
+    2. Any identified issues or recommendations.
+    3. Additional insights based on the trip summary.
+
+    Return both the trip summary and the detailed report in **Spanish**.
+"""
+
+# The prompts above are indented for readability only; that indentation would be sent on every call.
+travel_guide_qa_tpl = PromptTemplate(compact_prompt(travel_guide_qa_str))
+trip_report_synthesis_tpl = PromptTemplate(compact_prompt(trip_report_synthesis_str))
+agent_prompt_tpl = PromptTemplate(compact_prompt(agent_prompt_str))
+function_calling_agent_prompt = compact_prompt(function_calling_agent_prompt_str)
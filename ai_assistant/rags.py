@@ -1,5 +1,9 @@
 import os
+import json
+from functools import cache
+from threading import RLock
 from llama_index.core import (
+    Document,
     VectorStoreIndex,
     StorageContext,
     load_index_from_storage,
@@ -7,17 +11,63 @@ from llama_index.core import (
     PromptTemplate,
     Settings,
 )
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import LLM
 from llama_index.core.query_engine import RetrieverQueryEngine
-from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from ai_assistant.config import get_agent_settings
+from ai_assistant.ingestion import EmbeddingCache, IngestionRunner
+from ai_assistant.keyword_index import KeywordIndex
+from ai_assistant.retrieval import RetrievalCache, TravelGuideRetriever, get_node_postprocessors
+from ai_assistant.vector_store import MmapVectorStore
 
 SETTINGS = get_agent_settings()
 
-llm = OpenAI(model="gpt-4o-mini", api_key=SETTINGS.openai_api_key)
-embed_model = HuggingFaceEmbedding(model_name=SETTINGS.hf_embeddings_model)
-Settings.embed_model = embed_model
-Settings.llm = llm
+
+# Models and the index are created on first use, so importing the tools (for
+# example in a worker that only makes reservations) does not load them.
+@cache
+def get_llm() -> LLM:
+    if SETTINGS.llm_backend == "mock":
+        from ai_assistant.mocks import MockLLM
+
+        llm = MockLLM(latency=SETTINGS.mock_llm_latency_seconds, tokens_per_second=SETTINGS.mock_llm_tokens_per_second)
+    else:
+        from ai_assistant.llm_client import managed_llm_from_settings
+
+        llm = managed_llm_from_settings()
+    Settings.llm = llm
+    return llm
+
+
+@cache
+def get_embed_model() -> BaseEmbedding:
+    if SETTINGS.embeddings_backend == "mock":
+        from ai_assistant.mocks import HashEmbedding
+
+        embed_model = HashEmbedding(model_name="hash", embed_batch_size=SETTINGS.embed_batch_size)
+    elif SETTINGS.embeddings_backend == "onnx":
+        from ai_assistant.onnx_embeddings import onnx_embedding_from_settings
+
+        embed_model = onnx_embedding_from_settings()
+    else:
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+        embed_model = HuggingFaceEmbedding(
+            model_name=SETTINGS.hf_embeddings_model, embed_batch_size=SETTINGS.embed_batch_size
+        )
+    Settings.embed_model = embed_model
+    return embed_model
+
+
+STORE_FILES = ("docstore.json", "index_store.json", "default__vector_store.json")
+# Names the embedding model of the stored vectors; stores from another backend are rebuilt.
+EMBED_MODEL_FILE = "embed_model.json"
+KEYWORD_INDEX_FILE = "keyword_index.db"
+
+
+def file_metadata(file_path: str) -> dict:
+    # Only path-derived metadata, so a document's hash changes only with its content.
+    return {"file_path": file_path, "file_name": os.path.basename(file_path)}
 
 
 class TravelGuideRAG:
@@ -28,24 +78,163 @@ class TravelGuideRAG:
         qa_prompt_tpl: PromptTemplate | None = None,
     ):
         self.store_path = store_path
+        self.data_dir = data_dir
+        self.retrieval_cache = RetrievalCache(
+            max_embeddings=SETTINGS.retrieval_cache_max_embeddings,
+            max_results=SETTINGS.retrieval_cache_max_results,
+            bucket_decimals=SETTINGS.retrieval_cache_bucket_decimals,
+        )
+
+        os.makedirs(store_path, exist_ok=True)
+        self.keyword_index = KeywordIndex(os.path.join(store_path, KEYWORD_INDEX_FILE))
 
-        if not os.path.exists(store_path) and data_dir is not None:
+        self.index = self.load_index(store_path)
+        if self.index is None:
+            if data_dir is None or not os.path.isdir(data_dir):
+                raise RuntimeError(
+                    f"The travel guide store at {store_path} is missing or corrupt "
+                    f"and there is no data directory to rebuild it from"
+                )
             self.index = self.ingest_data(store_path, data_dir)
-        else:
-            self.index = load_index_from_storage(
-                StorageContext.from_defaults(persist_dir=store_path)
-            )
+        elif self.keyword_index.count() == 0:
+            # Stores persisted before the keyword index existed: index the chunks already in the docstore.
+            self.keyword_index.add(list(self.index.docstore.docs.values()))
 
         self.qa_prompt_tpl = qa_prompt_tpl
 
-    def ingest_data(self, store_path: str, data_dir: str) -> VectorStoreIndex:
-        documents = SimpleDirectoryReader(data_dir).load_data()
-        index = VectorStoreIndex.from_documents(documents, show_progress=True)
+    def load_index(self, store_path: str) -> VectorStoreIndex | None:
+        for file_name in STORE_FILES:
+            path = os.path.join(store_path, file_name)
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                return None
+        if self.stored_model_name(store_path) not in (None, get_embed_model().model_name):
+            return None
+        try:
+            if SETTINGS.vector_store_backend == "mmap":
+                # A store persisted by another backend is rebuilt, from the embedding cache.
+                if not MmapVectorStore.is_persisted(store_path):
+                    return None
+                storage_context = StorageContext.from_defaults(
+                    persist_dir=store_path,
+                    vector_store=MmapVectorStore.from_persist_dir(store_path, **self.vector_store_kwargs()),
+                )
+            else:
+                storage_context = StorageContext.from_defaults(persist_dir=store_path)
+            return load_index_from_storage(storage_context, embed_model=get_embed_model())
+        except (ValueError, KeyError, OSError):
+            return None
+
+    @staticmethod
+    def stored_model_name(store_path: str) -> str | None:
+        path = os.path.join(store_path, EMBED_MODEL_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            return json.load(file).get("model_name")
+
+    def persist(self, index: VectorStoreIndex, store_path: str):
         index.storage_context.persist(persist_dir=store_path)
+        with open(os.path.join(store_path, EMBED_MODEL_FILE), "w") as file:
+            json.dump({"model_name": get_embed_model().model_name}, file)
+
+    def vector_store_kwargs(self) -> dict:
+        return {
+            "ivf_min_vectors": SETTINGS.vector_index_ivf_min_vectors,
+            "nprobe": SETTINGS.vector_index_nprobe,
+        }
+
+    def new_storage_context(self) -> StorageContext:
+        if SETTINGS.vector_store_backend == "mmap":
+            return StorageContext.from_defaults(vector_store=MmapVectorStore(**self.vector_store_kwargs()))
+        return StorageContext.from_defaults()
+
+    def load_documents(self, data_dir: str) -> list[Document]:
+        return SimpleDirectoryReader(
+            data_dir, recursive=True, filename_as_id=True, file_metadata=file_metadata
+        ).load_data()
+
+    def get_ingestion_runner(self) -> IngestionRunner:
+        os.makedirs(self.store_path, exist_ok=True)
+        embed_model = get_embed_model()
+        cache = EmbeddingCache(
+            SETTINGS.embedding_cache_path or os.path.join(self.store_path, "embedding_cache.db"),
+            embed_model.model_name,
+        )
+        return IngestionRunner(
+            embed_model,
+            cache=cache,
+            batch_size=SETTINGS.embed_batch_size,
+            num_workers=SETTINGS.ingest_workers,
+        )
+
+    def insert_documents(self, index: VectorStoreIndex, documents: list[Document]):
+        if not documents:
+            return
+        nodes = self.get_ingestion_runner().run(documents)
+        index.insert_nodes(nodes)
+        self.keyword_index.add(nodes)
+        for document in documents:
+            index.docstore.set_document_hash(document.doc_id, document.hash)
+
+    def ingest_data(self, store_path: str, data_dir: str) -> VectorStoreIndex:
+        index = VectorStoreIndex(
+            nodes=[], storage_context=self.new_storage_context(), embed_model=get_embed_model()
+        )
+        self.keyword_index.clear()
+        self.insert_documents(index, self.load_documents(data_dir))
+        self.persist(index, store_path)
         return index
 
-    def get_query_engine(self) -> RetrieverQueryEngine:
-        query_engine = self.index.as_query_engine()
+    def refresh(self) -> dict:
+        """Embeds new and changed files in the data directory and drops removed ones."""
+        documents = self.load_documents(self.data_dir)
+        docstore = self.index.docstore
+        stored_ids = set(docstore.get_all_ref_doc_info() or {})
+
+        added = [document for document in documents if document.doc_id not in stored_ids]
+        updated = [
+            document
+            for document in documents
+            if document.doc_id in stored_ids
+            and docstore.get_document_hash(document.doc_id) != document.hash
+        ]
+        removed = stored_ids - {document.doc_id for document in documents}
+
+        for ref_doc_id in removed | {document.doc_id for document in updated}:
+            self.index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+            self.keyword_index.delete(ref_doc_id)
+        self.insert_documents(self.index, added + updated)
+        self.persist(self.index, self.store_path)
+        if added or updated or removed:
+            self.retrieval_cache.clear_results()
+
+        return {
+            "added": len(added),
+            "updated": len(updated),
+            "removed": len(removed),
+            "unchanged": len(documents) - len(added) - len(updated),
+        }
+
+    def get_query_engine(self, retrieval_mode: str | None = None) -> RetrieverQueryEngine:
+        mode = retrieval_mode or SETTINGS.retrieval_mode
+        retriever = TravelGuideRetriever(
+            self.index,
+            get_embed_model(),
+            self.retrieval_cache,
+            top_k=SETTINGS.retrieval_top_k,
+            prefilter=SETTINGS.retrieval_prefilter,
+            keyword_index=self.keyword_index,
+            mode=mode,
+            candidates=SETTINGS.retrieval_hybrid_candidates,
+            rrf_k=SETTINGS.retrieval_rrf_k,
+        )
+        # The cutoff is a cosine similarity; keyword and fused scores are on other scales.
+        cutoff = SETTINGS.retrieval_similarity_cutoff if mode == "vector" else None
+        query_engine = RetrieverQueryEngine.from_args(
+            retriever,
+            llm=get_llm(),
+            node_postprocessors=get_node_postprocessors(cutoff, SETTINGS.reranker_model, SETTINGS.reranker_top_n),
+        )
 
         if self.qa_prompt_tpl is not None:
             query_engine.update_prompts(
@@ -53,3 +242,40 @@ class TravelGuideRAG:
             )
 
         return query_engine
+
+
+@cache
+def get_travel_guide() -> TravelGuideRAG:
+    from ai_assistant.prompts import travel_guide_qa_tpl
+
+    return TravelGuideRAG(
+        store_path=SETTINGS.travel_guide_store_path,
+        data_dir=SETTINGS.travel_guide_data_path,
+        qa_prompt_tpl=travel_guide_qa_tpl,
+    )
+
+
+# Concurrent first calls, e.g. parallel tool calls without a warmup, must not build the index twice.
+_build_lock = RLock()
+
+
+@cache
+def get_travel_guide_query_engine() -> RetrieverQueryEngine:
+    with _build_lock:
+        return get_travel_guide().get_query_engine()
+
+
+def warmup():
+    get_llm()
+    get_travel_guide_query_engine()
+
+
+def is_warm() -> bool:
+    return get_travel_guide_query_engine.cache_info().currsize > 0
+
+
+if __name__ == "__main__":
+    from ai_assistant.observability import configure_logging
+
+    configure_logging()
+    print(get_travel_guide().refresh())
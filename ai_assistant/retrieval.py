@@ -0,0 +1,331 @@
+import re
+import hashlib
+import unicodedata
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from threading import Lock
+from typing import TYPE_CHECKING, Callable
+import numpy as np
+from llama_index.core import VectorStoreIndex
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import FilterOperator, MetadataFilter, MetadataFilters
+from ai_assistant.executor import run_blocking
+
+if TYPE_CHECKING:
+    from ai_assistant.keyword_index import KeywordIndex
+
+RETRIEVAL_MODES = ("vector", "keyword", "hybrid")
+
+CITIES = {
+    "La Paz": ["la paz"],
+    "El Alto": ["el alto"],
+    "Sucre": ["sucre"],
+    "Potosi": ["potosi"],
+    "Cochabamba": ["cochabamba"],
+    "Santa Cruz": ["santa cruz"],
+    "Oruro": ["oruro"],
+    "Tarija": ["tarija"],
+    "Trinidad": ["trinidad"],
+    "Cobija": ["cobija"],
+    "Uyuni": ["uyuni"],
+    "Tupiza": ["tupiza"],
+    "Copacabana": ["copacabana", "lago titicaca", "lake titicaca"],
+    "Coroico": ["coroico"],
+    "Sorata": ["sorata"],
+    "Rurrenabaque": ["rurrenabaque"],
+    "Samaipata": ["samaipata"],
+}
+
+CATEGORIES = {
+    "hotel": [
+        "hotel", "hotels", "hoteles", "hostal", "hostales", "hostel", "hostels",
+        "alojamiento", "residencial", "sleeping", "lodge", "lodges",
+    ],
+    "restaurant": [
+        "restaurant", "restaurants", "restaurante", "restaurantes", "eating", "comida", "cafe", "cafes", "food",
+    ],
+    "activity": [
+        "tour", "tours", "trek", "treks", "trekking", "hike", "hikes", "excursion", "excursions",
+        "actividades", "activities",
+    ],
+    "place": [
+        "museum", "museums", "museo", "museos", "iglesia", "iglesias", "church", "churches", "plaza", "plazas",
+        "catedral", "cathedral", "cathedrals", "sights", "mirador", "miradores", "places", "lugares",
+    ],
+}
+
+# A negation and the rest of its clause, as in "not restaurants or hotels". Quotes
+# and brackets end the clause too, so one note does not negate the next.
+NEGATED_CLAUSE = re.compile(r"\b(?:not|no|without|except|excluding|sin|excepto|salvo|ni)\b[^.;:!?()\[\]'\"]*")
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def mentions(text: str, vocabulary: dict[str, list[str]]) -> Counter:
+    text = normalize(text)
+    return Counter(
+        {
+            label: count
+            for label, terms in vocabulary.items()
+            if (count := sum(len(re.findall(rf"\b{term}\b", text)) for term in terms))
+        }
+    )
+
+
+def tag_node(node: BaseNode):
+    """Adds the city and category a chunk mentions most, for prefiltering retrieval."""
+    text = node.get_content()
+    for key, vocabulary in (("city", CITIES), ("category", CATEGORIES)):
+        counts = mentions(text, vocabulary)
+        if counts:
+            node.metadata[key] = counts.most_common(1)[0][0]
+            # Kept out of the embedded text so cached chunk embeddings stay valid.
+            node.excluded_embed_metadata_keys.append(key)
+
+
+@dataclass(frozen=True)
+class RetrievalScope:
+    city: str | None = None
+    category: str | None = None
+
+
+# The city and category of a structured request, which prefilter retrieval instead of
+# those inferred from the query text. run_blocking copies it into executor threads.
+current_retrieval_scope: ContextVar[RetrievalScope] = ContextVar("current_retrieval_scope", default=RetrievalScope())
+
+
+@contextmanager
+def retrieval_scope(city: str | None = None, category: str | None = None):
+    token = current_retrieval_scope.set(RetrievalScope(city, category))
+    try:
+        yield
+    finally:
+        current_retrieval_scope.reset(token)
+
+
+def query_filters(query: str, scope: RetrievalScope = RetrievalScope()) -> list[MetadataFilters | None]:
+    """Filters to try in order, from most to least specific, ending with no filter.
+
+    The scope's city and category are used when given; otherwise they are
+    inferred from the query, ignoring negated mentions.
+    """
+    query = NEGATED_CLAUSE.sub(" ", normalize(query))
+    cities = sorted(mentions(scope.city, CITIES) if scope.city else mentions(query, CITIES))
+    categories = [scope.category] if scope.category else sorted(mentions(query, CATEGORIES))
+    city_filter = MetadataFilter(key="city", value=cities, operator=FilterOperator.IN)
+    category_filter = MetadataFilter(key="category", value=categories, operator=FilterOperator.IN)
+
+    cascade = []
+    if cities and categories:
+        cascade.append(MetadataFilters(filters=[city_filter, category_filter]))
+    if cities:
+        cascade.append(MetadataFilters(filters=[city_filter]))
+    return cascade + [None]
+
+
+class LRU:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class RetrievalCache:
+    """Query text -> query embedding, and (embedding bucket, retrieval params) -> nodes.
+
+    Embeddings are bucketed by rounding the unit-normalized vector, so queries
+    that embed almost identically share retrieved nodes. Retrieved nodes depend
+    on the index contents and must be cleared when it is re-ingested; query
+    embeddings only depend on the model and are kept.
+    """
+
+    def __init__(self, max_embeddings: int, max_results: int, bucket_decimals: int):
+        self.embeddings = LRU(max_embeddings)
+        self.results = LRU(max_results)
+        self.bucket_decimals = bucket_decimals
+        self._lock = Lock()
+
+    def embedding(self, query: str, embed: Callable[[], list[float]]) -> list[float]:
+        with self._lock:
+            embedding = self.embeddings.get(query)
+        if embedding is None:
+            embedding = embed()
+            with self._lock:
+                self.embeddings.set(query, embedding)
+        return embedding
+
+    def bucket(self, embedding: list[float], scope: str) -> str:
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        rounded = np.rint(vector * 10**self.bucket_decimals).astype(np.int32)
+        return hashlib.sha1(scope.encode() + rounded.tobytes()).hexdigest()
+
+    def nodes(self, key: str) -> list[NodeWithScore] | None:
+        with self._lock:
+            return self.results.get(key)
+
+    def set_nodes(self, key: str, nodes: list[NodeWithScore]):
+        with self._lock:
+            self.results.set(key, nodes)
+
+    def clear_results(self):
+        with self._lock:
+            self.results.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"query_embeddings": self.embeddings.stats(), "retrieved_nodes": self.results.stats()}
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """Ids ranked by the sum of 1 / (k + rank) over the rankings they appear in."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class TravelGuideRetriever(BaseRetriever):
+    """Vector, keyword (BM25) or hybrid retrieval prefiltered on the cities and categories a query mentions.
+
+    Filters are relaxed until some chunk matches, so questions about places
+    missing from the guide still get an answer. Hybrid retrieval fuses the
+    ``candidates`` best chunks of each kind with reciprocal rank fusion, so
+    its scores are fusion scores rather than similarities. Query embeddings
+    and vector results are reused from a RetrievalCache; keyword lookups are
+    cheap enough to always run.
+    """
+
+    def __init__(
+        self,
+        index: VectorStoreIndex,
+        embed_model: BaseEmbedding,
+        cache: RetrievalCache,
+        top_k: int = 4,
+        prefilter: bool = True,
+        keyword_index: "KeywordIndex | None" = None,
+        mode: str = "vector",
+        candidates: int = 10,
+        rrf_k: int = 60,
+    ):
+        super().__init__()
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        if mode != "vector" and keyword_index is None:
+            raise ValueError(f"The {mode} retrieval mode needs a keyword index")
+        self.index = index
+        self.embed_model = embed_model
+        self.cache = cache
+        self.top_k = top_k
+        self.prefilter = prefilter
+        self.keyword_index = keyword_index
+        self.mode = mode
+        self.candidates = max(candidates, top_k)
+        self.rrf_k = rrf_k
+
+    def _search(self, query_bundle: QueryBundle, filters: MetadataFilters | None, top_k: int) -> list[NodeWithScore]:
+        scope = f"top_k={top_k}:{filters.model_dump_json() if filters else ''}"
+        key = self.cache.bucket(query_bundle.embedding, scope)
+        nodes = self.cache.nodes(key)
+        if nodes is None:
+            retriever = self.index.as_retriever(similarity_top_k=top_k, filters=filters)
+            nodes = retriever.retrieve(query_bundle)
+            self.cache.set_nodes(key, nodes)
+        return nodes
+
+    def _keyword_search(self, query: str, filters: MetadataFilters | None, top_k: int) -> list[NodeWithScore]:
+        nodes = []
+        for node_id, score in self.keyword_index.search(query, top_k, filters):
+            node = self.index.docstore.get_node(node_id, raise_error=False)
+            if node is not None:
+                nodes.append(NodeWithScore(node=node, score=score))
+        return nodes
+
+    def _fuse(self, vector_nodes: list[NodeWithScore], keyword_nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        by_id = {node.node.node_id: node.node for node in keyword_nodes + vector_nodes}
+        fused = reciprocal_rank_fusion(
+            [[node.node.node_id for node in vector_nodes], [node.node.node_id for node in keyword_nodes]], self.rrf_k
+        )
+        return [NodeWithScore(node=by_id[node_id], score=score) for node_id, score in fused[: self.top_k]]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        cascade = query_filters(query_bundle.query_str, current_retrieval_scope.get()) if self.prefilter else [None]
+        if self.mode == "keyword":
+            for filters in cascade:
+                nodes = self._keyword_search(query_bundle.query_str, filters, self.top_k)
+                if nodes:
+                    break
+            return nodes
+
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self.cache.embedding(
+                query_bundle.query_str,
+                lambda: self.embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs),
+            )
+        top_k = self.top_k if self.mode == "vector" else self.candidates
+        for filters in cascade:
+            nodes = self._search(query_bundle, filters, top_k)
+            if nodes:
+                break
+        if self.mode == "hybrid":
+            return self._fuse(nodes, self._keyword_search(query_bundle.query_str, filters, self.candidates))
+        # Postprocessors may rescore nodes in place, so callers get their own copies.
+        return [NodeWithScore(node=node.node, score=node.score) for node in nodes]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        # Query embedding and search are CPU-bound, so they run on the tool executor
+        # rather than on the event loop.
+        return await run_blocking(self._retrieve, query_bundle)
+
+
+def get_node_postprocessors(
+    similarity_cutoff: float | None, reranker_model: str | None, reranker_top_n: int
+) -> list[BaseNodePostprocessor]:
+    postprocessors = []
+    if similarity_cutoff is not None:
+        from llama_index.core.postprocessor import SimilarityPostprocessor
+
+        postprocessors.append(SimilarityPostprocessor(similarity_cutoff=similarity_cutoff))
+    if reranker_model is not None:
+        # Needs sentence-transformers, which the HuggingFace embeddings already pull in.
+        from llama_index.core.postprocessor import SentenceTransformerRerank
+
+        postprocessors.append(SentenceTransformerRerank(model=reranker_model, top_n=reranker_top_n))
+    return postprocessors
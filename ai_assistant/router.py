@@ -0,0 +1,72 @@
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable
+from ai_assistant.budget import fit_observation
+from ai_assistant.executor import run_blocking
+from ai_assistant.observability import timed
+from ai_assistant.prompts import trip_report_synthesis_tpl
+from ai_assistant.rags import get_llm
+from ai_assistant.retrieval import retrieval_scope
+from ai_assistant.tools import atravel_guide, summarize_trip
+
+
+@dataclass
+class FastPath:
+    """A structured request that always needs the same tool, answered without the ReAct loop.
+
+    The tool is called directly and its output either is the answer or is
+    turned into one with a single LLM call.
+    """
+
+    tool: str
+    run_tool: Callable[[], Awaitable[str]]
+    tool_input: dict = field(default_factory=dict)
+    synthesis_prompt: Callable[[str], str] | None = None
+
+
+def travel_guide_route(query: str, city: str | None = None, category: str | None = None) -> FastPath:
+    """The endpoint's own city and category prefilter retrieval, rather than those read off the prompt."""
+
+    async def run_tool() -> str:
+        # The guide's query engine already synthesizes the answer from the retrieved chunks.
+        with retrieval_scope(city, category):
+            return await atravel_guide(query)
+
+    return FastPath("travel_guide", run_tool, {"input": query})
+
+
+def trip_report_route(trip_id: str | None = None) -> FastPath:
+    return FastPath(
+        "trip_summary",
+        lambda: run_blocking(summarize_trip, trip_id),
+        synthesis_prompt=lambda summary: trip_report_synthesis_tpl.format(trip_summary=fit_observation(summary)),
+    )
+
+
+async def run_tool(route: FastPath) -> str:
+    with timed("tool", route.tool):
+        return await route.run_tool()
+
+
+async def run_fast_path(route: FastPath) -> str:
+    output = await run_tool(route)
+    if route.synthesis_prompt is None:
+        return output
+    return (await get_llm().acomplete(route.synthesis_prompt(output))).text
+
+
+async def stream_fast_path(route: FastPath) -> AsyncIterator[tuple[str, dict]]:
+    """Same events as streaming.stream_agent_events, for a fast path."""
+    yield "tool_call", {"tool": route.tool, "input": route.tool_input}
+    output = await run_tool(route)
+    yield "tool_result", {"output": output}
+
+    if route.synthesis_prompt is None:
+        response = output
+        yield "token", {"text": response}
+    else:
+        response = ""
+        async for chunk in await get_llm().astream_complete(route.synthesis_prompt(output)):
+            response = chunk.text
+            yield "token", {"text": chunk.delta or ""}
+
+    yield "done", {"response": response}
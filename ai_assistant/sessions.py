@@ -0,0 +1,217 @@
+import time
+import asyncio
+import sqlite3
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import cache
+from llama_index.core.llms import ChatMessage
+from llama_index.core.memory import ChatSummaryMemoryBuffer
+from llama_index.core.storage.chat_store import BaseChatStore, SimpleChatStore
+from ai_assistant.config import get_agent_settings
+from ai_assistant.executor import run_blocking
+from ai_assistant.pool import get_agent_pool
+from ai_assistant.rags import get_llm
+
+
+class SqliteChatStore(BaseChatStore):
+    """Chat histories in SQLite, so sessions survive restarts and are shared between workers."""
+
+    path: str
+
+    def __init__(self, path: str):
+        super().__init__(path=path)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS chat_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS chat_messages_key ON chat_messages (key, id);
+                """
+            )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SqliteChatStore"
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def set_messages(self, key: str, messages: list[ChatMessage]) -> None:
+        with self._connect() as connection:
+            connection.execute("DELETE FROM chat_messages WHERE key = ?", (key,))
+            connection.executemany(
+                "INSERT INTO chat_messages (key, message, created_at) VALUES (?, ?, ?)",
+                [(key, message.model_dump_json(), time.time()) for message in messages],
+            )
+
+    def get_messages(self, key: str) -> list[ChatMessage]:
+        with self._connect() as connection:
+            rows = connection.execute("SELECT message FROM chat_messages WHERE key = ? ORDER BY id", (key,))
+            return [ChatMessage.model_validate_json(message) for (message,) in rows]
+
+    def add_message(self, key: str, message: ChatMessage) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO chat_messages (key, message, created_at) VALUES (?, ?, ?)",
+                (key, message.model_dump_json(), time.time()),
+            )
+
+    def delete_messages(self, key: str) -> list[ChatMessage] | None:
+        messages = self.get_messages(key)
+        with self._connect() as connection:
+            connection.execute("DELETE FROM chat_messages WHERE key = ?", (key,))
+        return messages or None
+
+    def delete_message(self, key: str, idx: int) -> ChatMessage | None:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT id, message FROM chat_messages WHERE key = ? ORDER BY id LIMIT 1 OFFSET ?", (key, idx)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute("DELETE FROM chat_messages WHERE id = ?", (row[0],))
+        return ChatMessage.model_validate_json(row[1])
+
+    def delete_last_message(self, key: str) -> ChatMessage | None:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT id, message FROM chat_messages WHERE key = ? ORDER BY id DESC LIMIT 1", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute("DELETE FROM chat_messages WHERE id = ?", (row[0],))
+        return ChatMessage.model_validate_json(row[1])
+
+    def get_keys(self) -> list[str]:
+        with self._connect() as connection:
+            return [key for (key,) in connection.execute("SELECT DISTINCT key FROM chat_messages")]
+
+    def delete_idle(self, idle_since: float, keep: list[str] = ()) -> int:
+        """Deletes the histories whose last message is older than ``idle_since``, except ``keep``."""
+        placeholders = ", ".join("?" * len(keep))
+        with self._connect() as connection:
+            return connection.execute(
+                "DELETE FROM chat_messages WHERE key IN "
+                "(SELECT key FROM chat_messages GROUP BY key HAVING max(created_at) < ?) "
+                f"AND key NOT IN ({placeholders})",
+                (idle_since, *keep),
+            ).rowcount
+
+
+@dataclass
+class Session:
+    memory: ChatSummaryMemoryBuffer
+    last_used: float = field(default_factory=time.time)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class SessionManager:
+    """Per-session chat memory for the agent.
+
+    Each session keeps its history in a ChatSummaryMemoryBuffer: once the
+    history is over ``token_limit`` the oldest turns are summarized by the
+    LLM. Sessions idle for ``idle_seconds`` are dropped, and past
+    ``max_sessions`` the least recently used ones are. Sessions with a turn
+    in progress are kept either way.
+    """
+
+    def __init__(
+        self,
+        chat_store: BaseChatStore,
+        token_limit: int,
+        idle_seconds: float,
+        max_sessions: int,
+    ):
+        self.chat_store = chat_store
+        self.token_limit = token_limit
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+
+    def _evict(self):
+        idle_since = time.time() - self.idle_seconds
+        # Sessions with a turn in progress are never dropped: their history is
+        # still being written, and a new Session would not share their lock.
+        busy = [session_id for session_id, session in self._sessions.items() if session.lock.locked()]
+        evicted = [
+            session_id
+            for session_id, session in self._sessions.items()
+            if session_id not in busy and session.last_used < idle_since
+        ]
+        # Room for the session about to be created, least recently used first.
+        overflow = max(len(self._sessions) - len(evicted) - self.max_sessions + 1, 0)
+        skip = {*busy, *evicted}
+        evicted += [session_id for session_id in self._sessions if session_id not in skip][:overflow]
+        for session_id in evicted:
+            del self._sessions[session_id]
+
+        if isinstance(self.chat_store, SqliteChatStore):
+            # Other workers may still be using a session this one has dropped, so
+            # persisted histories expire on their own last message instead.
+            self.chat_store.delete_idle(idle_since, keep=busy)
+        else:
+            for session_id in evicted:
+                self.chat_store.delete_messages(session_id)
+
+    def get_session(self, session_id: str) -> Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            self._evict()
+            memory = ChatSummaryMemoryBuffer.from_defaults(
+                llm=get_llm(),
+                chat_store=self.chat_store,
+                chat_store_key=session_id,
+                token_limit=self.token_limit,
+            )
+            session = self._sessions[session_id] = Session(memory)
+        session.last_used = time.time()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def end_session(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self.chat_store.delete_messages(session_id)
+
+    async def chat(self, session_id: str, message: str) -> str:
+        session = self.get_session(session_id)
+        # One turn at a time per session, so turns are not interleaved in the history.
+        async with session.lock:
+            # Summarizing old turns calls the LLM synchronously; do it off the event loop.
+            await run_blocking(session.memory.get)
+            async with get_agent_pool().checkout() as agent:
+                default_memory, agent.memory = agent.memory, session.memory
+                try:
+                    return str(await agent.achat(message))
+                finally:
+                    # The pool resets the agent's own memory, not the session's.
+                    agent.memory = default_memory
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._sessions)}
+
+
+@cache
+def get_session_manager() -> SessionManager:
+    settings = get_agent_settings()
+    if settings.session_store_path is not None:
+        chat_store = SqliteChatStore(settings.session_store_path)
+    else:
+        chat_store = SimpleChatStore()
+    return SessionManager(
+        chat_store,
+        token_limit=settings.session_token_limit,
+        idle_seconds=settings.session_idle_seconds,
+        max_sessions=settings.max_sessions,
+    )
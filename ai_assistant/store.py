@@ -0,0 +1,381 @@
+import os
+import re
+import json
+import sqlite3
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import cache, lru_cache
+from threading import Lock, RLock
+from ai_assistant.config import get_agent_settings
+from ai_assistant.models import TRIP_ID_PATTERN, ReservationAggregate, TripSummary
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+def reservation_city(record: dict) -> str:
+    return record.get("city", record.get("departure", "unknown"))
+
+
+def reservation_date(record: dict) -> str:
+    value = record.get("date", record.get("checkin_date", record.get("reservation_time", "unknown")))
+    return str(value)[:10]
+
+
+class ReservationStore:
+    """Append-only log of reservation records indexed by city, date and type."""
+
+    def append(self, record: dict):
+        self.extend([record])
+
+    def extend(self, records: list[dict]):
+        raise NotImplementedError
+
+    def extend_if_empty(self, records: list[dict]) -> bool:
+        """Appends the records only if the store has none, atomically across processes."""
+        raise NotImplementedError
+
+    def all(self) -> list[dict]:
+        raise NotImplementedError
+
+    def by_city(self, city: str) -> list[dict]:
+        raise NotImplementedError
+
+    def by_date(self, date_str: str) -> list[dict]:
+        raise NotImplementedError
+
+    def by_type(self, reservation_type: str) -> list[dict]:
+        raise NotImplementedError
+
+    def summary(self) -> TripSummary:
+        """Per-city and per-type aggregates, maintained as reservations are appended."""
+        raise NotImplementedError
+
+    def is_empty(self) -> bool:
+        return not self.all()
+
+
+class JsonLinesReservationStore(ReservationStore):
+    """One JSON record per line, appended under an exclusive file lock.
+
+    The in-memory indexes catch up with lines written by other processes by
+    reading from the last seen offset, so reads never re-parse the whole file.
+    """
+
+    def __init__(self, path: str):
+        if fcntl is None:
+            raise RuntimeError("The jsonl reservation store needs fcntl, use the sqlite store instead")
+        self.path = path
+        self._lock = RLock()
+        self._offset = 0
+        self._records: list[dict] = []
+        self._summary = TripSummary()
+        self._indexes: dict[str, defaultdict[str, list[int]]] = {
+            "city": defaultdict(list),
+            "date": defaultdict(list),
+            "type": defaultdict(list),
+        }
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        with self._lock, open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _index(self, record: dict):
+        position = len(self._records)
+        self._records.append(record)
+        self._indexes["city"][reservation_city(record)].append(position)
+        self._indexes["date"][reservation_date(record)].append(position)
+        self._indexes["type"][record.get("reservation_type", "unknown")].append(position)
+        self._summary.add(
+            reservation_city(record),
+            record.get("reservation_type", "unknown"),
+            reservation_date(record),
+            record.get("cost", 0),
+        )
+
+    def _catch_up(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == self._offset:
+            return
+        with open(self.path, "rb") as file:
+            file.seek(self._offset)
+            for line in file:
+                # A line without its newline is still being written by another process.
+                if not line.endswith(b"\n"):
+                    break
+                self._offset += len(line)
+                if line.strip():
+                    self._index(json.loads(line))
+
+    def _write(self, records: list[dict]):
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write("".join(json.dumps(record) + "\n" for record in records))
+        self._catch_up()
+
+    def extend(self, records: list[dict]):
+        with self._file_lock(exclusive=True):
+            self._catch_up()
+            self._write(records)
+
+    def extend_if_empty(self, records: list[dict]) -> bool:
+        with self._file_lock(exclusive=True):
+            self._catch_up()
+            if self._records:
+                return False
+            self._write(records)
+            return True
+
+    def _lookup(self, index: str, key: str) -> list[dict]:
+        with self._file_lock(exclusive=False):
+            self._catch_up()
+            return [self._records[position] for position in self._indexes[index].get(key, [])]
+
+    def all(self) -> list[dict]:
+        with self._file_lock(exclusive=False):
+            self._catch_up()
+            return list(self._records)
+
+    def by_city(self, city: str) -> list[dict]:
+        return self._lookup("city", city)
+
+    def by_date(self, date_str: str) -> list[dict]:
+        return self._lookup("date", date_str)
+
+    def by_type(self, reservation_type: str) -> list[dict]:
+        return self._lookup("type", reservation_type)
+
+    def summary(self) -> TripSummary:
+        with self._file_lock(exclusive=False):
+            self._catch_up()
+            return self._summary.model_copy(deep=True)
+
+
+class SqliteReservationStore(ReservationStore):
+    """Reservations in an indexed SQLite table; SQLite handles cross-process locking."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS reservations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    reservation_type TEXT NOT NULL,
+                    city TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS reservations_city ON reservations (city);
+                CREATE INDEX IF NOT EXISTS reservations_date ON reservations (date);
+                CREATE INDEX IF NOT EXISTS reservations_type ON reservations (reservation_type);
+                CREATE TABLE IF NOT EXISTS reservation_summary (
+                    city TEXT NOT NULL,
+                    reservation_type TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    cost INTEGER NOT NULL,
+                    first_date TEXT NOT NULL,
+                    last_date TEXT NOT NULL,
+                    PRIMARY KEY (city, reservation_type)
+                );
+                """
+            )
+            # Stores created before the summary table existed are aggregated once. The
+            # check and the insert share a write transaction so a concurrent append
+            # cannot land in between.
+            connection.execute("BEGIN IMMEDIATE")
+            if connection.execute("SELECT 1 FROM reservation_summary LIMIT 1").fetchone() is None:
+                connection.execute(
+                    """
+                    INSERT INTO reservation_summary
+                    SELECT city, reservation_type, count(*),
+                           coalesce(sum(json_extract(data, '$.cost')), 0), min(date), max(date)
+                    FROM reservations GROUP BY city, reservation_type
+                    """
+                )
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _insert(self, connection: sqlite3.Connection, records: list[dict]):
+        rows = [
+            (
+                record.get("reservation_type", "unknown"),
+                reservation_city(record),
+                reservation_date(record),
+                json.dumps(record),
+            )
+            for record in records
+        ]
+        connection.executemany(
+            "INSERT INTO reservations (reservation_type, city, date, data) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        connection.executemany(
+            """
+            INSERT INTO reservation_summary VALUES (?, ?, 1, ?, ?, ?)
+            ON CONFLICT (city, reservation_type) DO UPDATE SET
+                count = count + 1,
+                cost = cost + excluded.cost,
+                first_date = min(first_date, excluded.first_date),
+                last_date = max(last_date, excluded.last_date)
+            """,
+            [
+                (city, reservation_type, record.get("cost", 0), date_str, date_str)
+                for (reservation_type, city, date_str, _), record in zip(rows, records)
+            ],
+        )
+
+    def extend(self, records: list[dict]):
+        with self._connect() as connection:
+            self._insert(connection, records)
+
+    def extend_if_empty(self, records: list[dict]) -> bool:
+        with self._connect() as connection:
+            # The emptiness check and the insert share a write transaction.
+            connection.execute("BEGIN IMMEDIATE")
+            if connection.execute("SELECT 1 FROM reservations LIMIT 1").fetchone() is not None:
+                return False
+            self._insert(connection, records)
+            return True
+
+    def _select(self, where: str = "", params: tuple = ()) -> list[dict]:
+        with self._connect() as connection:
+            rows = connection.execute(f"SELECT data FROM reservations {where} ORDER BY id", params)
+            return [json.loads(data) for (data,) in rows]
+
+    def all(self) -> list[dict]:
+        return self._select()
+
+    def by_city(self, city: str) -> list[dict]:
+        return self._select("WHERE city = ?", (city,))
+
+    def by_date(self, date_str: str) -> list[dict]:
+        return self._select("WHERE date = ?", (date_str,))
+
+    def by_type(self, reservation_type: str) -> list[dict]:
+        return self._select("WHERE reservation_type = ?", (reservation_type,))
+
+    def summary(self) -> TripSummary:
+        summary = TripSummary()
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT city, reservation_type, count, cost, first_date, last_date FROM reservation_summary"
+            )
+            for city, reservation_type, count, cost, first_date, last_date in rows:
+                summary.cities.setdefault(city, {})[reservation_type] = ReservationAggregate(
+                    count=count, cost=cost, first_date=first_date, last_date=last_date
+                )
+                summary.total_reservations += count
+                summary.total_cost += cost
+        return summary
+
+    def is_empty(self) -> bool:
+        with self._connect() as connection:
+            return connection.execute("SELECT 1 FROM reservations LIMIT 1").fetchone() is None
+
+
+def import_trip_json(store: ReservationStore, path: str) -> int:
+    """Imports the legacy trip.json log into an empty store.
+
+    Workers starting together may all try; only the first finds the store empty.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0
+    with open(path, "r") as file:
+        try:
+            reservations = json.load(file)
+        except json.JSONDecodeError:
+            return 0
+    if not reservations or not store.extend_if_empty(reservations):
+        return 0
+    return len(reservations)
+
+
+STORES = {
+    "jsonl": JsonLinesReservationStore,
+    "sqlite": SqliteReservationStore,
+}
+
+STORE_EXTENSIONS = {"jsonl": "jsonl", "sqlite": "db"}
+
+
+@cache
+def open_reservation_store() -> ReservationStore:
+    settings = get_agent_settings()
+    if settings.reservation_store not in STORES:
+        raise ValueError(f"Unknown reservation store: {settings.reservation_store}")
+
+    path = settings.reservation_store_path or f"trip.{STORE_EXTENSIONS[settings.reservation_store]}"
+    is_new = not os.path.exists(path)
+    store = STORES[settings.reservation_store](path)
+    # One-time migration of the legacy trip.json log into a freshly created store.
+    if is_new:
+        import_trip_json(store, settings.log_file)
+    return store
+
+
+def trip_store_path(trip_id: str) -> str:
+    settings = get_agent_settings()
+    if not re.match(TRIP_ID_PATTERN, trip_id):
+        raise ValueError(f"Invalid trip id: {trip_id!r}")
+    return os.path.join(settings.trip_store_path, f"{trip_id}.{STORE_EXTENSIONS[settings.reservation_store]}")
+
+
+def trip_exists(trip_id: str) -> bool:
+    return os.path.exists(trip_store_path(trip_id))
+
+
+@lru_cache(maxsize=1024)
+def open_trip_store(trip_id: str) -> ReservationStore:
+    """The partition of one trip: its own store, so reads and summaries scale with the trip, not all traffic."""
+    settings = get_agent_settings()
+    if settings.reservation_store not in STORES:
+        raise ValueError(f"Unknown reservation store: {settings.reservation_store}")
+    path = trip_store_path(trip_id)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return STORES[settings.reservation_store](path)
+
+
+# Parallel tool calls can be the first to use the store, and each must get the same one.
+_store_lock = Lock()
+
+
+def get_reservation_store(trip_id: str | None = None) -> ReservationStore:
+    """The store of a trip, or the shared store of reservations made without one."""
+    with _store_lock:
+        return open_reservation_store() if trip_id is None else open_trip_store(trip_id)
+
+
+@dataclass(frozen=True)
+class TripScope:
+    trip_id: str | None = None
+    user_id: str | None = None
+
+
+# The trip the request being served books into and summarizes; agent tools read it from here
+# because their arguments come from the LLM. run_blocking copies it into executor threads.
+current_trip: ContextVar[TripScope] = ContextVar("current_trip", default=TripScope())
+
+
+@contextmanager
+def trip_scope(trip_id: str | None, user_id: str | None = None):
+    token = current_trip.set(TripScope(trip_id, user_id))
+    try:
+        yield
+    finally:
+        current_trip.reset(token)
@@ -0,0 +1,86 @@
+import json
+from typing import AsyncIterator
+from llama_index.core.agent import AgentRunner
+from llama_index.core.agent.react.types import ActionReasoningStep, ObservationReasoningStep
+from llama_index.core.agent.types import Task
+from llama_index.core.chat_engine.types import StreamingAgentChatResponse
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_agent_events(agent: AgentRunner, prompt: str) -> AsyncIterator[tuple[str, dict]]:
+    """Runs the agent step by step, yielding tool calls as they happen and then the answer tokens."""
+    task = agent.create_task(prompt)
+    if "current_reasoning" not in task.extra_state:
+        async for event in stream_function_calling_events(agent, task):
+            yield event
+        return
+    reasoning = task.extra_state["current_reasoning"]
+    seen = 0
+
+    while True:
+        step_output = await agent.astream_step(task.task_id)
+        for step in reasoning[seen:]:
+            if isinstance(step, ActionReasoningStep):
+                yield "tool_call", {"tool": step.action, "input": step.action_input}
+            elif isinstance(step, ObservationReasoningStep):
+                yield "tool_result", {"output": step.observation}
+        seen = len(reasoning)
+        if step_output.is_last:
+            break
+
+    output = step_output.output
+    if isinstance(output, StreamingAgentChatResponse):
+        async for token in output.async_response_gen():
+            yield "token", {"text": token}
+        response = output.response
+    else:
+        response = output.response
+        yield "token", {"text": response}
+
+    agent.finalize_response(task.task_id, step_output)
+    yield "done", {"response": response}
+
+
+def tool_input(raw_input: dict, parameters: list[str]) -> dict:
+    """A tool call's arguments by name.
+
+    Single-argument tools are called positionally, so their argument is in
+    ``args`` rather than ``kwargs``. Failed calls record the arguments as given.
+    """
+    if "args" not in raw_input and "kwargs" not in raw_input:
+        return raw_input
+    return {**dict(zip(parameters, raw_input.get("args", ()))), **raw_input.get("kwargs", {})}
+
+
+async def stream_function_calling_events(agent: AgentRunner, task: Task) -> AsyncIterator[tuple[str, dict]]:
+    """Same events for a function calling agent, which cannot stream its answer.
+
+    The tool calls of a step run concurrently, so their events come once the
+    whole step is done.
+    """
+    sources = task.extra_state["sources"]
+    parameters = {
+        tool.metadata.name: list(tool.metadata.get_parameters_dict()["properties"])
+        for tool in agent.agent_worker.get_tools(task.input)
+    }
+    seen = 0
+
+    while True:
+        step_output = await agent.arun_step(task.task_id)
+        for source in sources[seen:]:
+            yield "tool_call", {
+                "tool": source.tool_name,
+                "input": tool_input(source.raw_input, parameters.get(source.tool_name, [])),
+            }
+            yield "tool_result", {"output": source.content}
+        seen = len(sources)
+        if step_output.is_last:
+            break
+
+    response = step_output.output.response
+    yield "token", {"text": response}
+    agent.finalize_response(task.task_id, step_output)
+    yield "done", {"response": response}
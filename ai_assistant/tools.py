@@ -1,9 +1,11 @@
 import json
+import logging
+from functools import wraps
 from random import randint
 from datetime import date, datetime, time
-from llama_index.core.tools import QueryEngineTool, FunctionTool, ToolMetadata
-from ai_assistant.rags import TravelGuideRAG
-from ai_assistant.prompts import travel_guide_qa_tpl, travel_guide_description
+from llama_index.core.tools import FunctionTool
+from ai_assistant.rags import get_travel_guide_query_engine, is_warm
+from ai_assistant.prompts import travel_guide_description
 from ai_assistant.config import get_agent_settings
 from ai_assistant.models import (
     TripReservation,
@@ -12,20 +14,111 @@ from ai_assistant.models import (
     RestaurantReservation,
 )
 from ai_assistant.utils import save_reservation
-import wikipediaapi
+from ai_assistant.store import ReservationStore, current_trip, get_reservation_store
+from ai_assistant.executor import run_blocking, to_async
+from ai_assistant.observability import timed
+from ai_assistant.budget import budgeted, compact_description
+from ai_assistant.wikipedia import get_wikipedia_lookup
 
 SETTINGS = get_agent_settings()
+logger = logging.getLogger(__name__)
+
+
+def travel_guide(input: str) -> str:
+    return str(get_travel_guide_query_engine().query(input))
+
+
+async def atravel_guide(input: str) -> str:
+    """Async travel guide query. Only retrieval, which embeds the query on the CPU,
+    runs on the tool executor; the synthesis LLM call does not hold one of its threads.
+    """
+    query_engine = get_travel_guide_query_engine() if is_warm() else await run_blocking(get_travel_guide_query_engine)
+    return str(await query_engine.aquery(input))
+
+
+def timed_tool(name: str, async_fn):
+    @wraps(async_fn)
+    async def timed_fn(*args, **kwargs):
+        with timed("tool", name):
+            return await async_fn(*args, **kwargs)
+
+    return timed_fn
+
+
+def agent_tool(fn, description: str | None = None, async_fn=None) -> FunctionTool:
+    """Tool with a compact description and an output cut to the observation budget.
+
+    Without an ``async_fn``, the blocking function runs on the tool executor
+    for the async path.
+    """
+    fn = budgeted(fn)
+    if async_fn is None:
+        async_fn = to_async(fn)
+    else:
+        async_fn = timed_tool(fn.__name__, budgeted(async_fn))
+    return FunctionTool.from_defaults(
+        fn=fn,
+        async_fn=async_fn,
+        name=fn.__name__,
+        description=compact_description(description or fn.__doc__),
+        return_direct=False,
+    )
+
+
+travel_guide_tool = agent_tool(travel_guide, travel_guide_description, atravel_guide)
+
+# Reservations are built separately from the tools so that a whole itinerary
+# can be validated before any of it is saved.
+def trip_fields() -> dict:
+    """The trip and user of the request being served, for the reservations it makes."""
+    trip = current_trip.get()
+    return {"trip_id": trip.trip_id, "user_id": trip.user_id}
+
+
+def flight_reservation(destination: str, origin: str, date_str: str) -> TripReservation:
+    return TripReservation(
+        trip_type=TripType.flight,
+        departure=origin,
+        destination=destination,
+        date=date.fromisoformat(date_str),
+        cost=randint(200, 700),
+        **trip_fields(),
+    )
+
+
+def bus_reservation(date_str: str, origin: str, destination: str) -> TripReservation:
+    return TripReservation(
+        trip_type=TripType.bus,
+        departure=origin,
+        destination=destination,
+        date=date.fromisoformat(date_str),
+        cost=randint(50, 350),
+        **trip_fields(),
+    )
+
+
+def hotel_reservation(checkin_str: str, checkout_str: str, hotel_name: str, city: str) -> HotelReservation:
+    return HotelReservation(
+        checkin_date=date.fromisoformat(checkin_str),
+        checkout_date=date.fromisoformat(checkout_str),
+        hotel_name=hotel_name,
+        city=city,
+        cost=randint(500, 1000),
+        **trip_fields(),
+    )
 
-travel_guide_tool = QueryEngineTool(
-    query_engine=TravelGuideRAG(
-        store_path=SETTINGS.travel_guide_store_path,
-        data_dir=SETTINGS.travel_guide_data_path,
-        qa_prompt_tpl=travel_guide_qa_tpl,
-    ).get_query_engine(),
-    metadata=ToolMetadata(
-        name="travel_guide", description=travel_guide_description, return_direct=False
-    ),
-)
+
+def restaurant_reservation(
+    reservation_time_str: str, restaurant: str, city: str, dish: str = "not specified"
+) -> RestaurantReservation:
+    return RestaurantReservation(
+        reservation_time=datetime.fromisoformat(reservation_time_str),
+        restaurant=restaurant,
+        city=city,
+        dish=dish,
+        cost=randint(100, 500),
+        **trip_fields(),
+    )
 
 def reserve_flight(destination: str, origin: str, date_str: str) -> TripReservation:
     """
@@ -48,22 +141,14 @@ def reserve_flight(destination: str, origin: str, date_str: str) -> TripReservat
     - Use this tool when the user asks to book a flight.
     """
 
-    print(
-        f"Making flight reservation from {origin} to {destination} on date: {date}"
-    )
-    reservation = TripReservation(
-        trip_type=TripType.flight,
-        departure=origin,
-        destination=destination,
-        date=date.fromisoformat(date_str),
-        cost=randint(200, 700),
-    )
+    logger.info("Making flight reservation from %s to %s on date: %s", origin, destination, date_str)
+    reservation = flight_reservation(destination, origin, date_str)
 
     save_reservation(reservation)
     return reservation
 
 
-flight_tool = FunctionTool.from_defaults(fn=reserve_flight, return_direct=False)
+flight_tool = agent_tool(reserve_flight)
 
 def reserve_bus(date_str: str, origin: str, destination: str) -> TripReservation:
     """
@@ -85,19 +170,13 @@ def reserve_bus(date_str: str, origin: str, destination: str) -> TripReservation
     - The reservation details are stored.
     - Use this tool when the user asks to book a bus trip.
     """
-    print(f"Making bus reservation from {origin} to {destination} on date: {date_str}")
-    reservation = TripReservation(
-        trip_type=TripType.bus,
-        departure=origin,
-        destination=destination,
-        date=date.fromisoformat(date_str),
-        cost=randint(50, 350),
-    )
+    logger.info("Making bus reservation from %s to %s on date: %s", origin, destination, date_str)
+    reservation = bus_reservation(date_str, origin, destination)
 
     save_reservation(reservation)
     return reservation
 
-bus_tool = FunctionTool.from_defaults(fn=reserve_bus, return_direct=False)
+bus_tool = agent_tool(reserve_bus)
 
 def reserve_hotel(checkin_str: str, checkout_str: str, hotel_name: str, city: str) -> HotelReservation:
     """
@@ -121,19 +200,13 @@ def reserve_hotel(checkin_str: str, checkout_str: str, hotel_name: str, city: st
     - The reservation details are stored.
     - Use this tool when the user asks to book a hotel stay.
     """
-    print(f"Making hotel reservation at {hotel_name} in {city} from {checkin_str} to {checkout_str}")
-    reservation = HotelReservation(
-        checkin_date=date.fromisoformat(checkin_str),
-        checkout_date=date.fromisoformat(checkout_str),
-        hotel_name=hotel_name,
-        city=city,
-        cost=randint(500, 1000),
-    )
+    logger.info("Making hotel reservation at %s in %s from %s to %s", hotel_name, city, checkin_str, checkout_str)
+    reservation = hotel_reservation(checkin_str, checkout_str, hotel_name, city)
 
     save_reservation(reservation)
     return reservation
 
-hotel_tool = FunctionTool.from_defaults(fn=reserve_hotel, return_direct=False)
+hotel_tool = agent_tool(reserve_hotel)
 
 def reserve_restaurant(reservation_time_str: str, restaurant: str, city: str, dish: str = "not specified") -> RestaurantReservation:
     """
@@ -157,92 +230,74 @@ def reserve_restaurant(reservation_time_str: str, restaurant: str, city: str, di
     - The reservation details are stored for future reference.
     - Use this tool when the user asks to book a restaurant reservation.
     """
-    reservation_time = datetime.fromisoformat(reservation_time_str)
-    print(f"Making restaurant reservation at {restaurant} in {city} at {reservation_time}")
-    reservation = RestaurantReservation(
-        reservation_time=reservation_time,
-        restaurant=restaurant,
-        city=city,
-        dish=dish,
-        cost=randint(100, 500),
-    )
+    logger.info("Making restaurant reservation at %s in %s at %s", restaurant, city, reservation_time_str)
+    reservation = restaurant_reservation(reservation_time_str, restaurant, city, dish)
 
     save_reservation(reservation)
     return reservation
 
-restaurant_tool = FunctionTool.from_defaults(fn=reserve_restaurant, return_direct=False)
+restaurant_tool = agent_tool(reserve_restaurant)
 
-def trip_summary() -> str:
+def trip_summary(detailed: bool = False) -> str:
     """
-    This tool generates a summary of the user's trip based on their reservations. It provides a list of reservations by city with their individual costs and also the total cost of the trip.
+    This tool generates a summary of the user's trip based on their reservations. It provides the reservations by city with their dates and costs and also the total cost of the trip.
 
     ### Usage
-    - Input: No input is required from the user.
-    - Output: The tool generates a detailed summary including:
-        - Activities in each city, along with their dates
+    - Input: The tool accepts one optional input:
+        1. **detailed**: If true, every reservation is listed with all its details. Defaults to false, which returns a compact summary.
+    - Output: The tool generates a summary including:
+        - Number of reservations of each type in each city, along with their date range and cost
         - Total cost of the trip
 
     ### Notes
-    - The tool gets all the trip data from the file trip.json.
+    - The tool gets all the trip data from the reservation store.
     - Use this tool to give users a full overview of their trip plans and costs.
+    - Only ask for the detailed summary when the user needs the details of individual reservations.
     """
-    with open(SETTINGS.log_file, "r") as file:
-        trip_data = json.load(file)
+    return summarize_trip(current_trip.get().trip_id, detailed)
 
-    activities_by_city = {}
-    total_cost = 0
 
-    for activity in trip_data:
-        city = activity.get('city', activity.get('departure', 'unknown'))
-        date = activity.get('date', activity.get('checkin_date', activity.get('reservation_time', 'unknown')))
-        cost = activity.get('cost', 0)
-        total_cost += cost
+def summarize_trip(trip_id: str | None, detailed: bool = False) -> str:
+    return format_trip_summary(get_reservation_store(trip_id), detailed)
 
-        if city not in activities_by_city:
-            activities_by_city[city] = []
 
-        activities_by_city[city].append({
-            'activity': activity.get('reservation_type', 'Actividad'),
-            'date': date,
-            'details': activity,
-        })
+def format_trip_summary(store: ReservationStore, detailed: bool = False) -> str:
+    trip = store.summary()
 
     summary = "Trip Summary:\n\n"
-    for city, activities in activities_by_city.items():
+    for city, aggregates in trip.cities.items():
         summary += f"City: {city}\n"
-        for activity in activities:
-            summary += f"  - Activity: {activity['activity']}\n"
-            summary += f"    Date: {activity['date']}\n"
-            summary += f"    Details: {json.dumps(activity['details'], indent=2)}\n"
-        summary += "\n"
-
-    summary += f"Total Cost: ${total_cost:.2f}\n"
+        for reservation_type, aggregate in aggregates.items():
+            summary += f"  - Activity: {reservation_type} x{aggregate.count}\n"
+            summary += f"    Dates: {aggregate.first_date} to {aggregate.last_date}\n"
+            summary += f"    Cost: ${aggregate.cost:.2f}\n"
+        if detailed:
+            for activity in store.by_city(city):
+                summary += f"  - Details: {json.dumps(activity)}\n"
+        summary += f"  City Cost: ${sum(a.cost for a in aggregates.values()):.2f}\n\n"
+
+    summary += f"Total Reservations: {trip.total_reservations}\n"
+    summary += f"Total Cost: ${trip.total_cost:.2f}\n"
 
     return summary
 
-trip_summary_tool = FunctionTool.from_defaults(fn=trip_summary, return_direct=False)
+trip_summary_tool = agent_tool(trip_summary)
 
-def get_wikipedia_page(lookup_term: str) -> str:
+def get_wikipedia_page(lookup_term: str, focus: str | None = None) -> str:
     """
     This tool is designed to retrieve the Wikipedia page for a given term. It allows the user to search for general information about cities, activities, places, and other travel-related topics.
 
     ### Usage
-    - Input: The tool requires one input:
+    - Input: The tool requires one input and accepts one optional input:
         1. **lookup_term**: The term to search for in Wikipedia (e.g., a city, a place in a city, an event in a city, a holiday in a city, etc.).
+        2. **focus**: (Optional) What you want to know about the term (e.g., "hotels", "history", "festivals"). Only the most relevant sections of the page are returned.
 
     ### Output
-    - The tool returns the full text of the Wikipedia page if found. If not, it returns a message saying no page was found.
+    - The tool returns the summary of the Wikipedia page and its most relevant sections if found. If not, it returns a message saying no page was found.
 
     ### Notes
     - Use this tool to provide detailed background information or context about places the user is interested in.
     """
-    user_agent = 'SegundoParcial/1.0 (https://www.upb.edu/)'
-    wiki_wiki = wikipediaapi.Wikipedia(user_agent,'en')
-    page = wiki_wiki.page(lookup_term)
-    
-    if page.exists():
-        return page.text
-    else:
-        return f"No Wikipedia page found for {lookup_term}."
+    return get_wikipedia_lookup().lookup(lookup_term, focus)
 
-wikipedia_tool = FunctionTool.from_defaults(fn=get_wikipedia_page, return_direct=False)
\ No newline at end of file
+wikipedia_tool = agent_tool(get_wikipedia_page)
\ No newline at end of file
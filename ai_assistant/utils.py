@@ -1,41 +1,37 @@
-import os
-import json
-from datetime import date, datetime
+import logging
 from ai_assistant.models import (
     RestaurantReservation,
     TripReservation,
     HotelReservation,
-    TripType,
 )
-from ai_assistant.config import get_agent_settings
+from ai_assistant.store import get_reservation_store
 
-SETTINGS = get_agent_settings()
+logger = logging.getLogger(__name__)
 
 
-def custom_serializer(obj):
-    if isinstance(obj, (date, datetime)):
-        return obj.isoformat()  # Convert date and datetime to ISO 8601 string
-    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+def reservation_record(
+    reservation: RestaurantReservation | TripReservation | HotelReservation,
+) -> dict:
+    reservation_dict = reservation.model_dump(mode="json")
+    reservation_dict["reservation_type"] = reservation.__class__.__name__
+    return reservation_dict
 
 
 def save_reservation(
     reservation: RestaurantReservation | TripReservation | HotelReservation,
 ):
-    reservation_dict = reservation.model_dump()
-    print(f"saving reservation: {reservation_dict}")
-    reservations = []
-    if os.path.exists(SETTINGS.log_file) and os.path.getsize(SETTINGS.log_file) > 0:
-        with open(SETTINGS.log_file, "r") as file:
-            try:
-                reservations = json.load(file)
-            except json.JSONDecodeError:
-                reservation = []
-    else:
-        reservations = []
-    reservation_dict["reservation_type"] = reservation.__class__.__name__
-    reservations.append(reservation_dict)
+    reservation_dict = reservation_record(reservation)
+    get_reservation_store(reservation.trip_id).append(reservation_dict)
+    logger.info("Saved reservation", extra={"reservation": reservation_dict})
 
-    with open(SETTINGS.log_file, "w") as file:
-        json.dump(reservations, file, indent=4, default=custom_serializer)
 
-    print(f"saved reservation!")
+def save_reservations(
+    reservations: list[RestaurantReservation | TripReservation | HotelReservation],
+):
+    """Saves all the reservations of a trip in one write to its store, so either all or none are saved."""
+    trip_ids = {reservation.trip_id for reservation in reservations}
+    if len(trip_ids) > 1:
+        raise ValueError(f"Reservations saved together must belong to one trip, got {sorted(map(str, trip_ids))}")
+    records = [reservation_record(reservation) for reservation in reservations]
+    get_reservation_store(trip_ids.pop() if trip_ids else None).extend(records)
+    logger.info("Saved %d reservations", len(records))
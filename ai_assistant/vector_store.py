@@ -0,0 +1,229 @@
+import os
+import json
+from typing import Any, Sequence
+import numpy as np
+from pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.simple import _build_metadata_filter_fn
+
+BACKEND = "mmap"
+
+
+def scalar_metadata(node: BaseNode) -> dict:
+    return {
+        key: value
+        for key, value in node.metadata.items()
+        if value is None or isinstance(value, (str, int, float, bool))
+    }
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means: unit-norm centroids and the list each vector belongs to."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for list_id in range(k):
+            members = vectors[assignments == list_id]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[list_id] = centroid / (np.linalg.norm(centroid) or 1.0)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """Unit-normalized float32 embeddings in one .npy file, memory-mapped on load.
+
+    Node text and metadata stay in the docstore; this store keeps ids, the
+    scalar metadata needed for filtering and the embedding matrix. Queries are
+    a single matrix-vector product. Above ``ivf_min_vectors`` an inverted file
+    index (k-means lists, ``nprobe`` lists searched per query) is built on
+    persist to avoid scanning the whole matrix.
+    """
+
+    stores_text: bool = False
+    ivf_min_vectors: int = 50_000
+    nprobe: int = 8
+
+    _ids: list[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: list[str] = PrivateAttr(default_factory=list)
+    _metadata: list[dict] = PrivateAttr(default_factory=list)
+    _embeddings: np.ndarray | None = PrivateAttr(default=None)
+    _pending: list[np.ndarray] = PrivateAttr(default_factory=list)
+    _deleted: set[int] = PrivateAttr(default_factory=set)
+    _centroids: np.ndarray | None = PrivateAttr(default=None)
+    _lists: list[np.ndarray] | None = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    @staticmethod
+    def paths(persist_path: str) -> tuple[str, str, str]:
+        base = persist_path.removesuffix(".json")
+        return persist_path, f"{base}.npy", f"{base}.ivf.npz"
+
+    @classmethod
+    def is_persisted(cls, persist_dir: str) -> bool:
+        manifest_path = os.path.join(persist_dir, "default__vector_store.json")
+        try:
+            with open(manifest_path) as file:
+                return json.load(file).get("backend") == BACKEND
+        except (OSError, ValueError):
+            return False
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, **kwargs: Any) -> "MmapVectorStore":
+        manifest_path, embeddings_path, ivf_path = cls.paths(
+            os.path.join(persist_dir, "default__vector_store.json")
+        )
+        store = cls(**kwargs)
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        store._ids = manifest["ids"]
+        store._ref_doc_ids = manifest["ref_doc_ids"]
+        store._metadata = manifest["metadata"]
+        if store._ids:
+            store._embeddings = np.load(embeddings_path, mmap_mode="r")
+        if os.path.exists(ivf_path):
+            ivf = np.load(ivf_path)
+            store._centroids = ivf["centroids"]
+            assignments = ivf["assignments"]
+            store._lists = [np.flatnonzero(assignments == i) for i in range(len(store._centroids))]
+        return store
+
+    @property
+    def count(self) -> int:
+        # Not __len__: llama_index tests vector stores for truthiness.
+        return len(self._ids) - len(self._deleted)
+
+    def matrix(self) -> np.ndarray:
+        if self._pending:
+            parts = ([self._embeddings] if self._embeddings is not None else []) + self._pending
+            self._embeddings = np.vstack(parts)
+            self._pending = []
+        if self._embeddings is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._embeddings
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> list[str]:
+        if not nodes:
+            return []
+        embeddings = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        self._pending.append(embeddings / np.where(norms == 0, 1.0, norms))
+        for node in nodes:
+            self._ids.append(node.node_id)
+            self._ref_doc_ids.append(node.ref_doc_id)
+            self._metadata.append(scalar_metadata(node))
+        # New rows are not in any inverted list yet; exact search until the next persist.
+        self._centroids, self._lists = None, None
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._deleted.update(
+            position for position, ref in enumerate(self._ref_doc_ids) if ref == ref_doc_id
+        )
+
+    def clear(self) -> None:
+        self._ids, self._ref_doc_ids, self._metadata = [], [], []
+        self._embeddings, self._pending, self._deleted = None, [], set()
+        self._centroids, self._lists = None, None
+
+    def _candidates(self, query: VectorStoreQuery, embedding: np.ndarray) -> np.ndarray | None:
+        """Row positions to score, or None to score every row."""
+        candidates = None
+        if self._lists is not None and not query.node_ids:
+            probes = np.argsort(-(self._centroids @ embedding))[: self.nprobe]
+            candidates = np.concatenate([self._lists[i] for i in probes])
+
+        if self._deleted or query.filters or query.node_ids:
+            if candidates is None:
+                candidates = np.arange(len(self._ids))
+            node_ids = set(query.node_ids or [])
+            filter_fn = _build_metadata_filter_fn(lambda i: self._metadata[int(i)], query.filters)
+            candidates = np.array(
+                [
+                    i
+                    for i in candidates
+                    if i not in self._deleted
+                    and (not node_ids or self._ids[i] in node_ids)
+                    and filter_fn(i)
+                ],
+                dtype=np.int64,
+            )
+        return candidates
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        matrix = self.matrix()
+        if query.query_embedding is None or not len(matrix):
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        embedding = np.asarray(query.query_embedding, dtype=np.float32)
+        embedding /= np.linalg.norm(embedding) or 1.0
+        candidates = self._candidates(query, embedding)
+        if candidates is None:
+            candidates = np.arange(len(matrix))
+            scores = matrix @ embedding
+        elif len(candidates):
+            scores = matrix[candidates] @ embedding
+        else:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        top_k = min(query.similarity_top_k, len(candidates))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return VectorStoreQueryResult(
+            similarities=scores[top].tolist(),
+            ids=[self._ids[candidates[i]] for i in top],
+        )
+
+    def persist(self, persist_path: str, fs: Any = None) -> None:
+        manifest_path, embeddings_path, ivf_path = self.paths(persist_path)
+        matrix = self.matrix()
+        keep = [i for i in range(len(self._ids)) if i not in self._deleted]
+        if self._deleted:
+            matrix = matrix[keep]
+            self._ids = [self._ids[i] for i in keep]
+            self._ref_doc_ids = [self._ref_doc_ids[i] for i in keep]
+            self._metadata = [self._metadata[i] for i in keep]
+            self._deleted = set()
+
+        os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+        if len(keep):
+            # Write next to the mapped file and swap, so readers never see a partial matrix.
+            with open(f"{embeddings_path}.tmp", "wb") as file:
+                np.save(file, np.ascontiguousarray(matrix, dtype=np.float32))
+            os.replace(f"{embeddings_path}.tmp", embeddings_path)
+            self._embeddings = np.load(embeddings_path, mmap_mode="r")
+        else:
+            self._embeddings = None
+
+        if len(keep) >= self.ivf_min_vectors:
+            self._centroids, assignments = kmeans(np.asarray(self._embeddings), int(np.sqrt(len(keep))))
+            np.savez(ivf_path, centroids=self._centroids, assignments=assignments)
+            self._lists = [np.flatnonzero(assignments == i) for i in range(len(self._centroids))]
+        else:
+            self._centroids, self._lists = None, None
+            if os.path.exists(ivf_path):
+                os.remove(ivf_path)
+
+        with open(manifest_path, "w") as file:
+            json.dump(
+                {
+                    "backend": BACKEND,
+                    "ids": self._ids,
+                    "ref_doc_ids": self._ref_doc_ids,
+                    "metadata": self._metadata,
+                },
+                file,
+            )
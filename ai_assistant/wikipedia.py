@@ -0,0 +1,179 @@
+import re
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from functools import cache
+from typing import Protocol
+import wikipediaapi
+from requests.adapters import HTTPAdapter
+from llama_index.core.utils import get_tokenizer
+from ai_assistant.config import get_agent_settings
+
+USER_AGENT = "SegundoParcial/1.0 (https://www.upb.edu/)"
+
+
+@dataclass
+class WikiPage:
+    title: str
+    summary: str
+    sections: list[tuple[str, str]] = field(default_factory=list)
+
+
+class PageFetcher(Protocol):
+    def fetch(self, title: str) -> WikiPage | None: ...
+
+
+class WikipediaApiFetcher:
+    """Fetches pages with one shared wikipediaapi client, reusing its HTTP connections."""
+
+    def __init__(self, language: str, pool_size: int, timeout: float):
+        self.client = wikipediaapi.Wikipedia(USER_AGENT, language, timeout=timeout)
+        # wikipediaapi does not expose its requests session, but sizing its pool
+        # lets every tool executor thread keep a connection open.
+        self.client._session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+
+    def fetch(self, title: str) -> WikiPage | None:
+        page = self.client.page(title)
+        if not page.exists():
+            return None
+        return WikiPage(page.title, page.summary, list(self._flatten(page.sections)))
+
+    def _flatten(self, sections, prefix: str = ""):
+        for section in sections:
+            title = f"{prefix}{section.title}"
+            if section.text:
+                yield title, section.text
+            yield from self._flatten(section.sections, f"{title} > ")
+
+
+class StaticFetcher:
+    """Serves pages from memory, a local stand-in for Wikipedia in tests and benchmarks."""
+
+    def __init__(self, pages: dict[str, WikiPage], latency: float = 0.0):
+        self.pages = {title.lower(): page for title, page in pages.items()}
+        self.latency = latency
+
+    def fetch(self, title: str) -> WikiPage | None:
+        if self.latency:
+            time.sleep(self.latency)
+        return self.pages.get(title.lower())
+
+
+class PageCache:
+    """SQLite cache of fetched pages; missing pages are cached too, with a shorter TTL."""
+
+    def __init__(self, path: str, ttl_seconds: float, negative_ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS wikipedia_pages (title TEXT PRIMARY KEY, page TEXT, expires_at REAL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, title: str) -> tuple[bool, WikiPage | None]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT page, expires_at FROM wikipedia_pages WHERE title = ?", (title.lower(),)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return False, None
+        if row[0] is None:
+            return True, None
+        page = json.loads(row[0])
+        return True, WikiPage(page["title"], page["summary"], [tuple(s) for s in page["sections"]])
+
+    def set(self, title: str, page: WikiPage | None):
+        ttl = self.ttl_seconds if page is not None else self.negative_ttl_seconds
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO wikipedia_pages VALUES (?, ?, ?)",
+                (title.lower(), None if page is None else json.dumps(asdict(page)), time.time() + ttl),
+            )
+
+
+class WikipediaLookup:
+    def __init__(self, fetcher: PageFetcher, cache: PageCache | None, token_budget: int):
+        self.fetcher = fetcher
+        self.cache = cache
+        self.token_budget = token_budget
+        self.tokenizer = get_tokenizer()
+
+    def get_page(self, title: str) -> WikiPage | None:
+        if self.cache is not None:
+            found, page = self.cache.get(title)
+            if found:
+                return page
+        page = self.fetcher.fetch(title)
+        if self.cache is not None:
+            self.cache.set(title, page)
+        return page
+
+    @staticmethod
+    def _terms(text: str) -> set[str]:
+        return {term for term in re.findall(r"\w+", text.lower()) if len(term) > 2}
+
+    def _tokens(self, text: str) -> int:
+        return len(self.tokenizer(text))
+
+    def lookup(self, lookup_term: str, focus: str | None = None) -> str:
+        page = self.get_page(lookup_term)
+        if page is None:
+            return f"No Wikipedia page found for {lookup_term}."
+
+        sections = list(enumerate(page.sections))
+        if focus:
+            # Most relevant sections first; ties keep the page order.
+            terms = self._terms(focus)
+            sections.sort(key=lambda item: -len(terms & self._terms(f"{item[1][0]} {item[1][1]}")))
+
+        text = f"{page.title}\n\n{page.summary}"
+        tokens = self._tokens(text)
+        if tokens > self.token_budget:
+            return text[: len(text) * self.token_budget // tokens]
+
+        budget = self.token_budget - tokens
+        selected = []
+        for position, (title, section_text) in sections:
+            cost = self._tokens(section_text) + self._tokens(title) + 2
+            if cost <= budget:
+                selected.append((position, title, section_text))
+                budget -= cost
+
+        for _, title, section_text in sorted(selected):
+            text += f"\n\n== {title} ==\n{section_text}"
+        return text
+
+
+@cache
+def get_wikipedia_lookup() -> WikipediaLookup:
+    settings = get_agent_settings()
+    page_cache = None
+    if settings.wikipedia_cache_path is not None:
+        page_cache = PageCache(
+            settings.wikipedia_cache_path,
+            settings.wikipedia_cache_ttl_seconds,
+            settings.wikipedia_negative_cache_ttl_seconds,
+        )
+    if settings.wikipedia_backend == "static":
+        from ai_assistant.mocks import STATIC_WIKIPEDIA_PAGES
+
+        fetcher = StaticFetcher(STATIC_WIKIPEDIA_PAGES)
+    else:
+        fetcher = WikipediaApiFetcher(
+            settings.wikipedia_language,
+            pool_size=settings.tool_executor_workers,
+            timeout=settings.wikipedia_timeout_seconds,
+        )
+    return WikipediaLookup(fetcher, page_cache, settings.wikipedia_token_budget)
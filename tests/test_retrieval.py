@@ -0,0 +1,32 @@
+from ai_assistant.retrieval import RetrievalScope, query_filters
+
+
+def filter_keys(filters):
+    return [(f.key, f.value) for f in filters.filters]
+
+
+def test_english_plural_category_is_prefiltered():
+    cascade = query_filters("hotels in Sucre")
+    assert filter_keys(cascade[0]) == [("city", ["Sucre"]), ("category", ["hotel"])]
+    assert filter_keys(cascade[1]) == [("city", ["Sucre"])]
+    assert cascade[-1] is None
+
+
+def test_spanish_and_english_queries_match_the_same_category():
+    assert filter_keys(query_filters("restaurants in La Paz")[0]) == filter_keys(
+        query_filters("restaurantes en La Paz")[0]
+    )
+    assert ("category", ["place"]) in filter_keys(query_filters("museums and churches in Potosí")[0])
+
+
+def test_negated_categories_are_not_prefiltered():
+    # The /recommendations/places prompt.
+    cascade = query_filters(
+        "Recommend places to visit in the Sucre in Bolivia. Only return places, not restaurants or hotels or activities."
+    )
+    assert filter_keys(cascade[0]) == [("city", ["Sucre"]), ("category", ["place"])]
+
+
+def test_scope_overrides_the_query():
+    cascade = query_filters("Recommend hotels to stay in the la paz in Bolivia.", RetrievalScope("Sucre", "place"))
+    assert filter_keys(cascade[0]) == [("city", ["Sucre"]), ("category", ["place"])]
@@ -0,0 +1,23 @@
+import asyncio
+from llama_index.core.agent import AgentRunner, FunctionCallingAgentWorker
+from llama_index.core.tools import FunctionTool
+from ai_assistant.mocks import MockLLM
+from ai_assistant.streaming import stream_agent_events
+
+
+def travel_guide(input: str) -> str:
+    return f"Guide for {input}"
+
+
+async def collect(agent: AgentRunner, prompt: str) -> list[tuple[str, dict]]:
+    return [event async for event in stream_agent_events(agent, prompt)]
+
+
+def test_function_calling_tool_call_shows_positional_argument():
+    tool = FunctionTool.from_defaults(fn=travel_guide)
+    agent = AgentRunner(FunctionCallingAgentWorker.from_tools([tool], llm=MockLLM()))
+
+    events = asyncio.run(collect(agent, "Lugares en Sucre"))
+
+    assert ("tool_call", {"tool": "travel_guide", "input": {"input": "Lugares en Sucre"}}) in events
+    assert ("tool_result", {"output": "Guide for Lugares en Sucre"}) in events